@@ -3,9 +3,20 @@ import warnings
 
 logging.basicConfig(format="%(asctime)s %(levelname)7s: %(message)s", datefmt="%Y/%m/%d %H:%M:%S")
 
-from .dataset import *
-from .pipeline import *
-from .preprocess import *
+from .lazy import lazy_module
+from . import cache, dataset, pipeline, preprocess
+
+__getattr__, __dir__, __all__ = lazy_module(__name__, {
+    "Executor": ".executor",
+    **{attribute: ".cache" for attribute in cache.__all__},
+    **{attribute: ".dataset" for attribute in dataset.__all__},
+    **{attribute: ".pipeline" for attribute in pipeline.__all__},
+    **{attribute: ".preprocess" for attribute in preprocess.__all__},
+})
 
 logging.getLogger().setLevel(logging.DEBUG)
+# Heavy dependencies are imported lazily after the root level is set,
+# silence the ones that enable debug tracing at import time
+logging.getLogger("matplotlib").setLevel(logging.WARNING)
+logging.getLogger("numba").setLevel(logging.WARNING)
 warnings.filterwarnings("ignore", category=RuntimeWarning)
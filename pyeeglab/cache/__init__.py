@@ -0,0 +1,5 @@
+from ..lazy import lazy_module
+
+__getattr__, __dir__, __all__ = lazy_module(__name__, {
+    "Cache": ".cache",
+})
@@ -0,0 +1,404 @@
+import os
+import json
+import logging
+import pickle
+import shutil
+import sqlite3
+import tempfile
+
+from contextlib import contextmanager
+from hashlib import md5
+from time import time
+from typing import Any, Dict, Iterator, List
+
+import numpy as np
+
+# Advisory file locks, fcntl on POSIX and msvcrt on Windows
+if os.name == "nt":
+    import msvcrt
+else:
+    import fcntl
+
+# Cache entries formats, 'numpy' stores arrays as memory-mapped .npy files
+FORMATS = ["pickle", "numpy"]
+
+
+class Cache():
+
+    def __init__(self, path: str, format: str = "pickle", max_size: int = None) -> None:
+        if format not in FORMATS:
+            raise ValueError("Unknown cache format '{}', use one of {}".format(format, FORMATS))
+        logging.debug("Make cache directory at %s", path)
+        self.path = path
+        self.format = format
+        self.max_size = max_size
+        os.makedirs(path, exist_ok=True)
+        self._init_manifest()
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        connection = sqlite3.connect(os.path.join(self.path, "manifest.db"), timeout=60)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def _init_manifest(self) -> None:
+        exists = os.path.exists(os.path.join(self.path, "manifest.db"))
+        with self._connect() as connection:
+            connection.execute("PRAGMA journal_mode = WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS entry ("
+                "key TEXT PRIMARY KEY, size INTEGER NOT NULL, "
+                "created REAL NOT NULL, accessed REAL NOT NULL, "
+                "metadata TEXT)"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS entry_accessed ON entry (accessed)")
+            # Running total of entries size, kept up to date by triggers
+            total = connection.execute("SELECT name FROM sqlite_master WHERE name = 'total'").fetchone()
+            connection.execute("CREATE TABLE IF NOT EXISTS total (id INTEGER PRIMARY KEY, size INTEGER NOT NULL)")
+            if total is None:
+                connection.execute("INSERT OR IGNORE INTO total SELECT 0, COALESCE(SUM(size), 0) FROM entry")
+            connection.execute(
+                "CREATE TRIGGER IF NOT EXISTS entry_insert AFTER INSERT ON entry "
+                "BEGIN UPDATE total SET size = size + NEW.size; END"
+            )
+            connection.execute(
+                "CREATE TRIGGER IF NOT EXISTS entry_delete AFTER DELETE ON entry "
+                "BEGIN UPDATE total SET size = size - OLD.size; END"
+            )
+            connection.execute(
+                "CREATE TRIGGER IF NOT EXISTS entry_update AFTER UPDATE OF size ON entry "
+                "BEGIN UPDATE total SET size = size + NEW.size - OLD.size; END"
+            )
+            # Metadata, e.g. pipelines JSON, are shared among many entries
+            connection.execute("CREATE TABLE IF NOT EXISTS metadata (key TEXT PRIMARY KEY, value TEXT)")
+            # Track entries written before the manifest existed
+            untracked = [] if exists else self.keys()
+            if untracked:
+                logging.debug("Add %d untracked entries to cache manifest", len(untracked))
+                connection.executemany(
+                    "INSERT OR IGNORE INTO entry VALUES (?, ?, ?, ?, NULL)",
+                    [(key, self._get_size(key), time(), time()) for key in untracked]
+                )
+
+    def _get_path(self, key: str) -> str:
+        return os.path.join(self.path, key + ".pkl")
+
+    def _get_manifest(self, key: str) -> str:
+        return os.path.join(self.path, key, "manifest.json")
+
+    def _get_size(self, key: str) -> int:
+        # Entries may be removed by other processes meanwhile, vanished files count zero
+        try:
+            return os.path.getsize(self._get_path(key))
+        except FileNotFoundError:
+            pass
+        path = os.path.join(self.path, key)
+        try:
+            names = os.listdir(path)
+        except FileNotFoundError:
+            return 0
+        size = 0
+        for name in names:
+            try:
+                size += os.path.getsize(os.path.join(path, name))
+            except FileNotFoundError:
+                continue
+        return size
+
+    def _remove(self, path: str) -> None:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def keys(self) -> List[str]:
+        return sorted(
+            os.path.splitext(name)[0]
+            for name in os.listdir(self.path)
+            if not name.startswith(".")
+            and (name.endswith(".pkl") or os.path.exists(self._get_manifest(name)))
+        )
+
+    def entries(self) -> List[Dict]:
+        # List the manifest, least recently used entries first
+        with self._connect() as connection:
+            rows = connection.execute(
+                "SELECT entry.key, size, created, accessed, metadata.value FROM entry "
+                "LEFT JOIN metadata ON entry.metadata = metadata.key ORDER BY accessed"
+            ).fetchall()
+        return [
+            dict(zip(["key", "size", "created", "accessed", "metadata"], row))
+            for row in rows
+        ]
+
+    @property
+    def size(self) -> int:
+        with self._connect() as connection:
+            return connection.execute("SELECT size FROM total").fetchone()[0]
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return self.get_many([key], default)[0]
+
+    def get_many(self, keys: List[str], default: Any = None) -> List[Any]:
+        values = [self._load(key, default) for key in keys]
+        # Update entries last access in a single transaction
+        found = [(time(), key) for key, value in zip(keys, values) if value is not default]
+        if found:
+            with self._connect() as connection:
+                connection.executemany("UPDATE entry SET accessed = ? WHERE key = ?", found)
+        return values
+
+    def _load(self, key: str, default: Any = None) -> Any:
+        # Entries may be replaced or evicted by other processes while reading,
+        # vanished files are retried once and then treated as missing entries
+        for _ in range(2):
+            try:
+                return self._load_entry(key)
+            except FileNotFoundError:
+                continue
+            except Exception as error:
+                logging.error("Loading cache entry %s failed: %s", key, error)
+                return default
+        return default
+
+    def _load_entry(self, key: str) -> Any:
+        if os.path.exists(self._get_manifest(key)):
+            return self._load_arrays(key)
+        path = self._get_path(key)
+        with open(path, "rb") as reader:
+            value = pickle.load(reader)
+        if self.format == "numpy" and self._is_arrays(value):
+            # Convert pickled entries on first access in numpy format
+            self._dump_arrays(key, value)
+            self._remove(path)
+            self._track([key])
+            return self._load_arrays(key)
+        return value
+
+    def set(self, key: str, value: Any, metadata: str = None) -> None:
+        self.set_many([key], [value], metadata)
+
+    def set_many(self, keys: List[str], values: List[Any], metadata: str = None) -> None:
+        for key, value in zip(keys, values):
+            if self.format == "numpy" and self._is_arrays(value):
+                self._dump_arrays(key, value)
+                self._remove(self._get_path(key))
+            else:
+                self._dump_pickle(key, value)
+                # Arrays entries take precedence, drop the replaced one
+                shutil.rmtree(os.path.join(self.path, key), ignore_errors=True)
+        self._track(keys, metadata)
+        if self.max_size is not None and self.size > self.max_size:
+            self.evict(self.max_size)
+
+    def _dump_pickle(self, key: str, value: Any) -> None:
+        # Write to a temporary file and rename it, readers never see partial entries
+        descriptor, path = tempfile.mkstemp(prefix="." + key, suffix=".tmp", dir=self.path)
+        try:
+            with os.fdopen(descriptor, "wb") as writer:
+                pickle.dump(value, writer)
+            os.replace(path, self._get_path(key))
+        except BaseException:
+            os.remove(path)
+            raise
+
+    @contextmanager
+    def lock(self, key: str) -> Iterator[None]:
+        # Advisory lock on key, concurrent producers wait for the first one
+        path = os.path.join(self.path, key + ".lock")
+        logging.debug("Acquire cache lock for %s", key)
+        while True:
+            lock = open(path, "a+b")
+            self._acquire(lock)
+            # Lock files may be purged while waiting, lock the new one
+            if self._is_current(lock, path):
+                break
+            self._release(lock)
+            lock.close()
+        try:
+            yield
+        finally:
+            self._release(lock)
+            lock.close()
+            logging.debug("Release cache lock for %s", key)
+
+    def _acquire(self, lock: Any, blocking: bool = True) -> bool:
+        if os.name == "nt":
+            while True:
+                try:
+                    lock.seek(0)
+                    msvcrt.locking(lock.fileno(), msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK, 1)
+                    return True
+                except OSError:
+                    if not blocking:
+                        return False
+        try:
+            fcntl.flock(lock.fileno(), fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+        return True
+
+    def _release(self, lock: Any) -> None:
+        if os.name == "nt":
+            lock.seek(0)
+            msvcrt.locking(lock.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            fcntl.flock(lock.fileno(), fcntl.LOCK_UN)
+
+    def _is_current(self, lock: Any, path: str) -> bool:
+        try:
+            return os.path.samestat(os.fstat(lock.fileno()), os.stat(path))
+        except FileNotFoundError:
+            return False
+
+    def _remove_lock(self, path: str) -> None:
+        # Remove lock files nobody holds, waiters notice it and lock a new file
+        try:
+            lock = open(path, "r+b")
+        except FileNotFoundError:
+            return
+        with lock:
+            if not self._acquire(lock, blocking=False):
+                return
+            try:
+                if self._is_current(lock, path):
+                    os.remove(path)
+            except OSError:
+                # Open files cannot be removed on Windows
+                pass
+            finally:
+                self._release(lock)
+
+    def _track(self, keys: List[str], metadata: str = None) -> None:
+        now = time()
+        with self._connect() as connection:
+            if metadata is not None:
+                value, metadata = metadata, md5(metadata.encode()).hexdigest()
+                connection.execute("INSERT OR IGNORE INTO metadata VALUES (?, ?)", (metadata, value))
+            # Update existing entries in place, replaced rows would skip the size triggers
+            sizes = [(key, self._get_size(key)) for key in keys]
+            connection.executemany(
+                "UPDATE entry SET size = ?, accessed = ?, metadata = COALESCE(?, metadata) WHERE key = ?",
+                [(size, now, metadata, key) for key, size in sizes]
+            )
+            connection.executemany(
+                "INSERT OR IGNORE INTO entry VALUES (?, ?, ?, ?, ?)",
+                [(key, size, now, now, metadata) for key, size in sizes]
+            )
+
+    def evict(self, max_size: int) -> List[str]:
+        # Remove least recently used entries until the cache fits max_size bytes
+        size = self.size
+        if size <= max_size:
+            return []
+        # Concurrent evictions would remove more entries than needed
+        with self.lock(".evict"):
+            size = self.size
+            evicted = []
+            with self._connect() as connection:
+                for key, entry in connection.execute("SELECT key, size FROM entry ORDER BY accessed"):
+                    if size <= max_size:
+                        break
+                    evicted.append(key)
+                    size -= entry
+            logging.info("Evict %d cache entries", len(evicted))
+            self.purge(evicted)
+        return evicted
+
+    def purge(self, keys: List[str] = None) -> None:
+        # Remove given entries, or all of them
+        locks = []
+        if keys is None:
+            keys = set(self.keys()) | {entry["key"] for entry in self.entries()}
+            locks = [name for name in os.listdir(self.path) if name.endswith(".lock")]
+        locks = set(locks) | {key + ".lock" for key in keys}
+        for key in keys:
+            self._remove(self._get_path(key))
+            shutil.rmtree(os.path.join(self.path, key), ignore_errors=True)
+        for name in locks:
+            self._remove_lock(os.path.join(self.path, name))
+        with self._connect() as connection:
+            connection.executemany("DELETE FROM entry WHERE key = ?", [(key,) for key in keys])
+            connection.execute(
+                "DELETE FROM metadata WHERE key NOT IN "
+                "(SELECT metadata FROM entry WHERE metadata IS NOT NULL)"
+            )
+
+    def _is_arrays(self, value: Any) -> bool:
+        # Ragged outputs, e.g. lists of DataFrames, fallback to pickle
+        if not isinstance(value, dict):
+            return False
+        for item in value.values():
+            if isinstance(item, np.ndarray):
+                if item.dtype.hasobject:
+                    return False
+                continue
+            try:
+                json.dumps(item)
+            except TypeError:
+                return False
+        return True
+
+    def _get_files(self, manifest: Dict) -> Dict[str, str]:
+        # Arrays file names, entries written by older versions use the arrays names
+        files = manifest.get("files", {})
+        return {name: files.get(name, name + ".npy") for name in manifest["arrays"]}
+
+    def _load_arrays(self, key: str) -> Dict:
+        with open(self._get_manifest(key), "r") as reader:
+            manifest = json.load(reader)
+        value = dict(manifest["values"])
+        for name, file in self._get_files(manifest).items():
+            # Copy-on-write views, pages are read on first access
+            value[name] = np.load(os.path.join(self.path, key, file), mmap_mode="c")
+        return value
+
+    def _dump_arrays(self, key: str, value: Dict) -> None:
+        # Entries evicted by other processes while writing are written again
+        try:
+            self._write_arrays(key, value)
+        except FileNotFoundError:
+            self._write_arrays(key, value)
+
+    def _write_arrays(self, key: str, value: Dict) -> None:
+        # Write arrays under unique names, then atomically replace the manifest,
+        # readers see either the previous entry or the new one, never a partial one
+        path = os.path.join(self.path, key)
+        os.makedirs(path, exist_ok=True)
+        try:
+            with open(self._get_manifest(key), "r") as reader:
+                previous = set(self._get_files(json.load(reader)).values())
+        except (OSError, ValueError):
+            previous = set()
+        files = {}
+        manifest = None
+        try:
+            for name, item in value.items():
+                if isinstance(item, np.ndarray):
+                    descriptor, file = tempfile.mkstemp(prefix="." + name, suffix=".npy", dir=path)
+                    files[name] = os.path.basename(file)
+                    with os.fdopen(descriptor, "wb") as writer:
+                        np.save(writer, item)
+            descriptor, manifest = tempfile.mkstemp(prefix=".manifest", suffix=".tmp", dir=path)
+            with os.fdopen(descriptor, "w") as writer:
+                json.dump({
+                    "arrays": list(files),
+                    "files": files,
+                    "values": {name: item for name, item in value.items() if name not in files},
+                }, writer)
+            os.replace(manifest, self._get_manifest(key))
+        except BaseException:
+            for file in files.values():
+                self._remove(os.path.join(path, file))
+            if manifest is not None:
+                self._remove(manifest)
+            raise
+        # Readers of the previous manifest retry on the new one
+        for file in previous - set(files.values()):
+            self._remove(os.path.join(path, file))
+
+    def __contains__(self, key: str) -> bool:
+        return os.path.exists(self._get_manifest(key)) or os.path.exists(self._get_path(key))
@@ -1,2 +1,13 @@
-from .physionet import *
-from .tuh_eeg import *
+from ..lazy import lazy_module
+
+__getattr__, __dir__, __all__ = lazy_module(__name__, {
+    "Dataset": ".dataset",
+    "File": ".file",
+    "Metadata": ".metadata",
+    "Annotation": ".annotation",
+    "PhysioNetCHBMITDataset": ".physionet.chbmit_dataset",
+    "PhysioNetEEGMMIDBDataset": ".physionet.eegmmidb_dataset",
+    "TUHEEGAbnormalDataset": ".tuh_eeg.abnormal_dataset",
+    "TUHEEGArtifactDataset": ".tuh_eeg.artifact_dataset",
+    "TUHEEGSeizureDataset": ".tuh_eeg.seizure_dataset",
+})
@@ -1,8 +1,10 @@
 from dataclasses import dataclass
-from mne.io import Raw, read_raw
+from typing import List
+from mne.io import Raw
 from sqlalchemy import Column, ForeignKey, Text, Float
 from sqlalchemy.orm import relationship
 from .declarative_base import Base
+from .edf import read_window
 
 
 @dataclass
@@ -19,12 +21,18 @@ class Annotation(Base):
     @property
     def duration(self) -> float:
         return self.end - self.begin
+
+    @property
+    def fingerprint(self) -> List:
+        # Identify the annotation window content by its file fingerprint
+        file = self.file
+        return [file.uuid, file.size, file.mtime, file.checksum, self.begin, self.end]
     
+    def read(self, channels: List[str] = None) -> Raw:
+        return read_window(self.file.path, self.begin, self.end, channels)
+
     def __enter__(self) -> Raw:
-        self.reader = read_raw(self.file.path)
-        tmax = self.reader.n_times / self.reader.info["sfreq"] - 0.1
-        tmax = tmax if self.end > tmax else self.end
-        self.reader.crop(self.begin, tmax)
+        self.reader = self.read()
         return self.reader
 
     def __exit__(self, *args, **kwargs) -> None:
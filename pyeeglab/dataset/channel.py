@@ -0,0 +1,10 @@
+from dataclasses import dataclass
+from sqlalchemy import Column, Text, Integer
+from .declarative_base import Base
+
+
+@dataclass
+class Channel(Base):
+    __tablename__ = "channel"
+    id: int = Column(Integer, primary_key=True)
+    name: str = Column(Text, nullable=False, unique=True)
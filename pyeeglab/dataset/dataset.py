@@ -2,27 +2,44 @@ import os
 import json
 import logging
 import hashlib
-import pickle
 
 from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from functools import reduce
-from multiprocessing import Pool, cpu_count
-from operator import add, and_
+from operator import and_, or_
+from time import time
 from uuid import uuid4, uuid5, NAMESPACE_X500
 
-from typing import Dict, List, Tuple
+from typing import Any, Callable, Dict, Iterator, List, Tuple
 
 import mne
-from sqlalchemy import create_engine
+import numpy as np
+from mne.io import Raw
+from sqlalchemy import create_engine, event, false, func, inspect
+from sqlalchemy.engine import Engine
 from sqlalchemy.orm import Session, sessionmaker, Query
 
 from .declarative_base import Base
+from .channel import Channel
 from .file import File
 from .metadata import Metadata
 from .annotation import Annotation
+from .edf import EDFHeader
+from .statistics import signal_statistics
 
+from ..cache import Cache
+from ..executor import Executor
 from ..pipeline import Pipeline
+from ..pipeline.task import Failure, Task
+
+# Default SQLite settings for the index
+INDEX_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "cache_size": -64000,
+    "mmap_size": 268435456,
+}
 
 
 @dataclass(init=False)
@@ -38,6 +55,14 @@ class Dataset(ABC):
     exclude_sampling_frequency: List[int]
     minimum_annotation_duration: float
 
+    checksum: bool
+    header_only: bool
+    index_pragmas: Dict
+
+    cache_max_size: int
+
+    executor: Executor
+
     session: Session
     query: Query
 
@@ -53,7 +78,12 @@ class Dataset(ABC):
             exclude_channels_set: List[str] = None,
             exclude_channels_reference: List[str] = None,
             exclude_sampling_frequency: List[str] = None,
-            minimum_annotation_duration: float = None
+            minimum_annotation_duration: float = None,
+            checksum: bool = False,
+            header_only: bool = False,
+            index_pragmas: Dict = None,
+            cache_max_size: int = None,
+            executor: Executor = None,
         ) -> None:
         # Set basic attributes
         self.path = os.path.abspath(os.path.join(path, version))
@@ -68,6 +98,17 @@ class Dataset(ABC):
         self.exclude_sampling_frequency = exclude_sampling_frequency if exclude_sampling_frequency else []
         self.minimum_annotation_duration = minimum_annotation_duration if minimum_annotation_duration else 0
 
+        # Set index attributes
+        self.checksum = checksum
+        self.header_only = header_only
+        self.index_pragmas = dict(INDEX_PRAGMAS, **(index_pragmas if index_pragmas else {}))
+
+        # Set cache attributes, cache size is bounded in bytes if given
+        self.cache_max_size = cache_max_size
+
+        # Set parallel executor, defaults to a process pool over available CPUs
+        self.executor = executor if executor is not None else Executor()
+
         logging.info("Init dataset '%s'@'%s' at '%s'", self.name, self.version, self.path)
 
         # Make workspace directory
@@ -100,46 +141,39 @@ class Dataset(ABC):
         logging.debug("Make index session")
         connection = os.path.join(self.path, ".pyeeglab", "index.sqlite3")
         connection = create_engine("sqlite:///" + connection)
+        event.listen(connection, "connect", self._set_index_pragmas)
+        self._check_index_schema(connection)
         Base.metadata.create_all(connection)
         self.session = sessionmaker(bind=connection)()
-        # Open multiprocess pool
         logging.info("Index data set directory")
-        pool = Pool(cpu_count())
-        # Get files path from data set path
-        paths = [
-            os.path.join(directory, filename)
-            for directory, _, filenames in os.walk(self.path)
-            for filename in filenames
-        ]
-        # Get Files instances form paths, filtering already indexed
-        files = self.session.query(File).all()
-        files = [file.uuid for file in files]
-        files = [
-            file
-            for file in pool.map(self._get_file, paths)
-            if file.uuid not in files
+        # Get files fingerprint from data set path, skipping workspace
+        stats = {}
+        for directory, directories, filenames in os.walk(self.path):
+            if ".pyeeglab" in directories:
+                directories.remove(".pyeeglab")
+            for filename in filenames:
+                path = os.path.join(directory, filename)
+                stat = os.stat(path)
+                stats[path] = (stat.st_size, stat.st_mtime)
+        # Compare fingerprints against already indexed files
+        indexed = self.session.query(File.path, File.size, File.mtime, File.checksum).all()
+        indexed = {path: (size, mtime, checksum) for path, size, mtime, checksum in indexed}
+        vanished = [path for path in indexed if path not in stats]
+        modified = [
+            path
+            for path, fingerprint in stats.items()
+            if path in indexed and indexed[path][:2] != fingerprint
         ]
-        for file in files:
-            logging.debug("Add file %s to index", file.uuid)
-        # Filter raw data files by extension
-        raws = [
-            file
-            for file in files
-            if os.path.splitext(file.path)[-1] in self.extensions
-        ]
-        # Get metadata and annotation for data files
-        metadatas = pool.map(self._get_metadata, raws)
-        annotations = pool.map(self._get_annotation, raws)
-        # Close multiprocess pool
-        pool.close()
-        pool.join()
-        # Commit insertions to index
-        commits = files + metadatas + reduce(add, annotations, [])
-        if commits:
-            logging.info("Commit insertions to index")
-            self.session.add_all(commits)
-            self.session.commit()
+        added = [path for path in stats if path not in indexed]
+        related = self._get_related_raws(vanished + modified + added, stats)
+        related += self._get_stale_raws(vanished + modified + added + related)
+        if vanished or modified or added or related:
+            self._update_index(indexed, vanished, modified, added, related)
+        else:
+            logging.info("Index data set is up to date")
         logging.info("Index data set completed")
+        # Invalidate aggregates of previous index generation
+        self._environment_cache = {}
         # Init default query
         logging.debug("Init default query")
         self.query = self.session.query(File, Metadata, Annotation).\
@@ -152,41 +186,219 @@ class Dataset(ABC):
         for file in self.exclude_file:
             self.query = self.query.filter(~File.path.like("%{}%".format(file)))
         logging.debug("SQL query representation: '%s'", str(self.query).replace("\n", ""))
-    
+
+    def _set_index_pragmas(self, connection, *args) -> None:
+        cursor = connection.cursor()
+        for key, value in self.index_pragmas.items():
+            cursor.execute("PRAGMA {} = {}".format(key, value))
+        cursor.close()
+
+    def _check_index_schema(self, connection: Engine) -> None:
+        # Drop outdated index, it will be rebuilt from scratch
+        inspector = inspect(connection)
+        tables = inspector.get_table_names()
+        for table in Base.metadata.sorted_tables:
+            if table.name not in tables:
+                continue
+            columns = {column["name"] for column in inspector.get_columns(table.name)}
+            if not {column.name for column in table.columns}.issubset(columns):
+                logging.warning("Index schema outdated, rebuilding index")
+                Base.metadata.drop_all(connection)
+                return
+
+    def _get_related_raws(self, paths: List[str], stats: Dict) -> List[str]:
+        # Annotations can be stored in sidecar files (e.g. '.tse', '.lbl', '.seizures'),
+        # unchanged raw files sharing the same stem must be reindexed when these change
+        changed = set(paths)
+        related = set()
+        for path in paths:
+            if os.path.splitext(path)[-1] in self.extensions:
+                continue
+            stem = os.path.splitext(path)[0]
+            related.update(
+                raw
+                for raw in [stem] + [stem + extension for extension in self.extensions]
+                if raw in stats and raw not in changed
+                and os.path.splitext(raw)[-1] in self.extensions
+            )
+        return sorted(related)
+
+    def _get_stale_raws(self, paths: List[str]) -> List[str]:
+        # Files indexed reading headers only lack signal statistics
+        if self.header_only:
+            return []
+        changed = set(paths)
+        stale = self.session.query(File.path).\
+            join(File.meta).\
+            filter(~Metadata.signal_statistics).\
+            all()
+        return [path for path, in stale if path not in changed]
+
+    def _update_index(
+            self,
+            indexed: Dict,
+            vanished: List[str],
+            modified: List[str],
+            added: List[str],
+            related: List[str],
+        ) -> None:
+        # Open executor pool
+        with self.executor as executor:
+            # Get Files instances from changed paths
+            files = executor.map(self._get_file, modified + added + related)
+            # Modified files with matching checksum need only a fingerprint update
+            touched = set(modified)
+            touched = {
+                file.path
+                for file in files
+                if file.path in touched
+                and file.checksum is not None
+                and file.checksum == indexed[file.path][2]
+            }
+            for file in files:
+                logging.debug("Add file %s to index", file.uuid)
+            # Filter raw data files by extension
+            raws = [
+                file
+                for file in files
+                if os.path.splitext(file.path)[-1] in self.extensions
+                and file.path not in touched
+            ]
+            # Get metadata and annotations for data files in a single pass
+            entries = executor.map(self._get_entries, raws)
+        metadatas = [metadata for metadata, _ in entries]
+        annotations = [annotations for _, annotations in entries]
+        # Remove vanished and outdated entries from index
+        removed = [self._get_uuid(path) for path in vanished + modified + related]
+        for uuid in removed:
+            logging.debug("Remove file %s from index", uuid)
+        outdated = [
+            self._get_uuid(path)
+            for path in vanished + modified + related
+            if path not in touched
+        ]
+        for i in range(0, len(outdated), 500):
+            for table in [Annotation, Metadata]:
+                self.session.query(table).\
+                    filter(table.file_uuid.in_(outdated[i:i+500])).\
+                    delete(synchronize_session=False)
+        for i in range(0, len(removed), 500):
+            self.session.query(File).\
+                filter(File.uuid.in_(removed[i:i+500])).\
+                delete(synchronize_session=False)
+        # Commit changes to index
+        logging.info("Commit changes to index")
+        start = time()
+        self._set_channels_mask(metadatas)
+        self._insert(File, files)
+        self._insert(Metadata, metadatas)
+        self._insert(Annotation, [a for annotation in annotations for a in annotation])
+        self.session.commit()
+        logging.info("Commit changes to index completed in %.2fs", time() - start)
+
+    def _insert(self, table: Base, rows: List[Base], batch_size: int = 10000) -> None:
+        # Bulk insert rows in batches, bypassing ORM unit of work
+        table = table.__table__
+        columns = [column.name for column in table.columns]
+        for i in range(0, len(rows), batch_size):
+            self.session.execute(table.insert(), [
+                {column: getattr(row, column) for column in columns}
+                for row in rows[i:i+batch_size]
+            ])
+
+    def _set_channels_mask(self, metadatas: List[Metadata]) -> None:
+        # Extend channels dictionary with unseen channel names
+        channels = self._get_channels_dictionary()
+        names = {
+            name
+            for metadata in metadatas
+            for name in json.loads(metadata.channels_set)
+        }
+        names = sorted(names - channels.keys())
+        self._insert(Channel, [
+            Channel(id=len(channels) + i, name=name)
+            for i, name in enumerate(names)
+        ])
+        channels.update({name: len(channels) + i for i, name in enumerate(names)})
+        # Encode channels set as hexadecimal bitmask over channels ids
+        for metadata in metadatas:
+            mask = self._encode_channels(json.loads(metadata.channels_set), channels)
+            metadata.channels_mask = "{:x}".format(mask)
+
+    def _get_channels_dictionary(self) -> Dict[str, int]:
+        return dict(self.session.query(Channel.name, Channel.id).all())
+
+    def _encode_channels(self, names: List[str], channels: Dict[str, int]) -> int:
+        return reduce(or_, [1 << channels[name] for name in names if name in channels], 0)
+
+    def _decode_channels(self, mask: int, channels: Dict[str, int]) -> List[str]:
+        return sorted(name for name, i in channels.items() if mask >> i & 1)
+
+    def _get_uuid(self, path: str) -> str:
+        return str(uuid5(NAMESPACE_X500, path))
+
     def _get_file(self, path: str) -> File:
+        stat = os.stat(path)
         return File(
-            uuid=str(uuid5(NAMESPACE_X500, path)),
+            uuid=self._get_uuid(path),
             path=path,
-            extension=os.path.splitext(path)[-1]
+            extension=os.path.splitext(path)[-1],
+            size=stat.st_size,
+            mtime=stat.st_mtime,
+            checksum=self._get_checksum(path) if self.checksum else None,
         )
 
-    def _get_metadata(self, file: File) -> Metadata:
-        logging.debug("Add file %s metadata to index", file.uuid)
+    def _get_checksum(self, path: str) -> str:
+        checksum = hashlib.md5()
+        with open(path, "rb") as reader:
+            for chunk in iter(lambda: reader.read(1 << 20), b""):
+                checksum.update(chunk)
+        return checksum.hexdigest()
+
+    def _get_entries(self, file: File) -> Tuple[Metadata, List[Annotation]]:
+        # Read only EDF headers if signal statistics are not requested
+        if self.header_only and file.extension.lower() == ".edf":
+            reader = EDFHeader.read(file.path)
+            return self._get_metadata(file, reader), self._get_annotation(file, reader)
+        # Open the recording once for both metadata and annotations
         with file as reader:
-            info = reader.info
-            metadata = Metadata(
-                file_uuid=file.uuid,
-                duration=reader.n_times/info["sfreq"],
-                channels_set=json.dumps(info["ch_names"]),
-                sampling_frequency=info["sfreq"],
-                max_value=reader.get_data().max(),
-                min_value=reader.get_data().min(),
-            )
+            metadata = self._get_metadata(file, reader)
+            annotations = self._get_annotation(file, reader)
+        return metadata, annotations
+
+    def _get_metadata(self, file: File, reader: Raw) -> Metadata:
+        logging.debug("Add file %s metadata to index", file.uuid)
+        info = reader.info
+        if isinstance(reader, EDFHeader):
+            # Fallback to channels physical range
+            min_value, max_value = reader.physical_range
+        else:
+            statistics = signal_statistics(reader)
+            min_value = float(statistics["min"].min())
+            max_value = float(statistics["max"].max())
+        metadata = Metadata(
+            file_uuid=file.uuid,
+            duration=reader.n_times/info["sfreq"],
+            channels_set=json.dumps(info["ch_names"]),
+            sampling_frequency=info["sfreq"],
+            max_value=max_value,
+            min_value=min_value,
+            signal_statistics=not isinstance(reader, EDFHeader),
+        )
         return metadata
 
-    def _get_annotation(self, file: File) -> List[Annotation]:
+    def _get_annotation(self, file: File, reader: Raw) -> List[Annotation]:
         logging.debug("Add file %s annotations to index", file.uuid)
-        with file as reader:
-            annotations = [
-                Annotation(
-                    uuid=str(uuid4()),
-                    file_uuid=file.uuid,
-                    begin=annotation[0],
-                    end=annotation[0]+annotation[1],
-                    label=annotation[2],
-                )
-                for annotation in reader.annotations
-            ]
+        annotations = [
+            Annotation(
+                uuid=str(uuid4()),
+                file_uuid=file.uuid,
+                begin=annotation["onset"],
+                end=annotation["onset"]+annotation["duration"],
+                label=annotation["description"],
+            )
+            for annotation in reader.annotations
+        ]
         return annotations
     
     @property
@@ -201,34 +413,51 @@ class Dataset(ABC):
     
     @property
     def lowest_frequency(self) -> float:
-        frequency = self.query.all()
-        frequency = min([
-            f[1].sampling_frequency
-            for f in frequency
-        ], default=0)
-        return frequency
+        def lowest_frequency() -> float:
+            frequency = self.query.with_entities(func.min(Metadata.sampling_frequency)).scalar()
+            return frequency if frequency is not None else 0
+        return self._memoize("lowest_frequency", lowest_frequency)
 
     @property
     def maximal_channels_subset(self) -> List[str]:
-        channels = self.query.group_by(Metadata.channels_set).all()
-        channels = [
-            frozenset(json.loads(channel[1].channels_set))
-            for channel in channels
-        ]
-        channels = reduce(and_, channels)
-        channels = channels - frozenset(self.exclude_channels_set)
-        channels = sorted(channels)
-        return channels
-    
+        def maximal_channels_subset() -> List[str]:
+            channels = self._get_channels_dictionary()
+            masks = self.query.with_entities(Metadata.channels_mask).\
+                group_by(Metadata.channels_mask).\
+                all()
+            mask = reduce(and_, [int(mask, 16) for mask, in masks])
+            mask &= ~self._encode_channels(self.exclude_channels_set, channels)
+            return self._decode_channels(mask, channels)
+        return self._memoize("maximal_channels_subset", maximal_channels_subset)
+
+    def with_channels_set(self, channels: List[str]) -> Query:
+        # Restrict default query to files containing all given channels
+        dictionary = self._get_channels_dictionary()
+        if not set(channels).issubset(dictionary.keys()):
+            return self.query.filter(false())
+        mask = self._encode_channels(channels, dictionary)
+        masks = self.query.with_entities(Metadata.channels_mask).\
+            group_by(Metadata.channels_mask).\
+            all()
+        masks = [m for m, in masks if int(m, 16) & mask == mask]
+        return self.query.filter(Metadata.channels_mask.in_(masks))
+
     @property
     def signal_min_max_range(self) -> Tuple[float]:
-        min_max = self.query.all()
-        min_max = [m[1] for m in min_max]
-        min_max = tuple([
-            min([m.min_value for m in min_max], default=0),
-            max([m.max_value for m in min_max], default=0),
-        ])
-        return min_max
+        def signal_min_max_range() -> Tuple[float]:
+            min_max = self.query.with_entities(
+                func.min(Metadata.min_value),
+                func.max(Metadata.max_value),
+            ).one()
+            return tuple(m if m is not None else 0 for m in min_max)
+        return self._memoize("signal_min_max_range", signal_min_max_range)
+
+    def _memoize(self, name: str, function: Callable) -> Any:
+        # Memoize aggregates for the current index generation and filters
+        key = (name, hash(self))
+        if key not in self._environment_cache:
+            self._environment_cache[key] = function()
+        return self._environment_cache[key]
     
     def set_pipeline(self, pipeline: Pipeline) -> "Dataset":
         self.pipeline = pipeline
@@ -240,42 +469,191 @@ class Dataset(ABC):
         self.minimum_annotation_duration = duration
         return self
     
-    def load(self) -> Dict:
-        # Compute cache path
-        cache = os.path.join(self.path, ".pyeeglab", "cache")
+    def load(self, cache_format: str = "pickle", shard_size: int = 1000, cache_result: bool = None) -> Dict:
+        # Results are rebuilt from the per-annotation entries, the assembled one is
+        # stored only if asked, or memory-mapped from a single entry in numpy format
+        if cache_result is None:
+            cache_result = cache_format == "numpy"
+        cache = self.get_cache(cache_format)
+        tasks = self._get_tasks()
+        pipeline, keys = self._get_tasks_keys(tasks)
         # Compute cache key
         logging.info("Compute cache key")
         name = self.__class__.__name__.lower()
         if name.endswith("dataset"):
             name = name[:-len("dataset")]
-        key = [hash(self), hash(self.pipeline)]
-        key = [str(k).encode() for k in key]
+        key = [hash(self), hash(self.pipeline), keys]
+        key = [json.dumps(k).encode() for k in key]
         key = [hashlib.md5(k).hexdigest()[:10] for k in key]
-        key = list(zip(["loader", "pipeline"], key))
+        key = list(zip(["loader", "pipeline", "annotations"], key))
         key = ["_".join(k) for k in key]
         key = name + "_" + "_".join(key)
         logging.info("Computed cache key: %s", key)
-        # Load file cache
-        cache = os.path.join(cache, key + ".pkl")
-        if os.path.exists(cache):
-            logging.info("Cache file found at %s", cache)
-            with open(cache, "rb") as reader:
-                try:
-                    logging.info("Loading cache file")
-                    return pickle.load(reader)
-                except:
-                    logging.error("Loading cache file failed")
-        # Cache file not found, start preprocessing
-        logging.info("Cache file not found, genereting new one")
-        data = [row[2] for row in self.query.all()]
-        data = self.pipeline.run(data)
-        with open(cache, "wb") as file:
-            logging.info("Dumping cache file")
-            pickle.dump(data, file)
+        # Concurrent loads wait for the first one to dump the cache file
+        with cache.lock(key):
+            # Load file cache
+            data = cache.get(key)
+            if data is not None:
+                logging.info("Cache file found for %s", key)
+                return data
+            # Cache file not found, preprocess missing annotations only
+            logging.info("Cache file not found, genereting new one")
+            data, failures = self._get_tasks_data(tasks, keys, pipeline, cache, shard_size)
+            if self.pipeline.profiler is not None:
+                logging.info("Pipeline profile:\n%s", self.pipeline.profiler.summary())
+            failed = {failure.index for failure in failures}
+            data = self.pipeline.encode(data, [task.label for i, task in enumerate(tasks) if i not in failed])
+            data["failures"] = [failure._asdict() for failure in failures]
+            if failures:
+                # Partial results are not cached, a rerun retries the failed annotations only
+                logging.warning("Preprocessing of %d annotations failed, skip cache file", len(failures))
+                return data
+            if cache_result:
+                logging.info("Dumping cache file")
+                cache.set(key, data, pipeline)
         return data
-    
+
+    def iter_batches(self, batch_size: int, shuffle: bool = False, seed: int = None) -> Iterator[Tuple]:
+        # Stream (x, y) batches, preprocessing only the annotations of the
+        # current batch missing from the cache, so memory stays bounded
+        cache = self.get_cache()
+        tasks = self._get_tasks()
+        pipeline, keys = self._get_tasks_keys(tasks)
+        labels, _ = self.pipeline.encode_labels([task.label for task in tasks])
+        order = np.arange(len(tasks))
+        if shuffle:
+            np.random.RandomState(seed).shuffle(order)
+        batches = [order[begin:begin + batch_size] for begin in range(0, len(order), batch_size)]
+        if not batches:
+            return
+        # Workers pool is kept open across batches, the next batch
+        # is preprocessed in background while the current one is consumed
+        with self.pipeline, ThreadPoolExecutor(1) as prefetcher:
+            pending = prefetcher.submit(self._get_batch, batches[0], tasks, keys, pipeline, cache)
+            for following in batches[1:] + [None]:
+                batch, data = pending.result()
+                if following is not None:
+                    pending = prefetcher.submit(self._get_batch, following, tasks, keys, pipeline, cache)
+                yield self.pipeline.encode_data(data), labels[batch]
+
+    def _get_batch(
+            self,
+            batch: np.ndarray,
+            tasks: List[Task],
+            keys: List[str],
+            pipeline: str,
+            cache: Cache
+        ) -> Tuple[np.ndarray, List]:
+        # Batch indexes without the skipped annotations, along with their outputs
+        data, failures = self._get_tasks_data(
+            [tasks[i] for i in batch],
+            [keys[i] for i in batch],
+            pipeline,
+            cache
+        )
+        return np.delete(batch, [failure.index for failure in failures]), data
+
+    def _get_tasks(self) -> List[Task]:
+        # Plain records detached from the index session, cheap to ship to workers
+        return [
+            Task.from_annotation(annotation, metadata.sampling_frequency, metadata.duration)
+            for _, metadata, annotation in self.query.all()
+        ]
+
+    def _get_tasks_keys(self, tasks: List[Task]) -> Tuple[str, List[str]]:
+        # Compute per-annotation cache keys, on the environment entries the
+        # pipeline reads, e.g. adding a file that widens min/max values does
+        # not invalidate the entries of a pipeline without normalization
+        pipeline = [self.pipeline.to_json(), self.pipeline.get_environment()]
+        if self.pipeline.group_by_file:
+            pipeline.append("group_by_file")
+        pipeline = json.dumps(pipeline, sort_keys=True, default=str)
+        keys = [self._get_task_key(task, pipeline) for task in tasks]
+        return pipeline, keys
+
+    def _get_task_key(self, task: Task, pipeline: str) -> str:
+        # Content-addressed key of a preprocessed annotation
+        key = task.fingerprint + [pipeline]
+        key = json.dumps(key).encode()
+        return hashlib.md5(key).hexdigest()
+
+    def _get_tasks_data(
+            self,
+            tasks: List[Task],
+            keys: List[str],
+            pipeline: str,
+            cache: Cache,
+            shard_size: int = 1000
+        ) -> Tuple[List, List[Failure]]:
+        # Return the tasks outputs, without the skipped ones, along with their failures
+        data = cache.get_many(keys)
+        missing = [i for i, d in enumerate(data) if d is None]
+        logging.info("Found %d cached annotations, preprocessing %d", len(data) - len(missing), len(missing))
+        output = None
+        if missing and self.pipeline.shared_output and self.pipeline.is_numpy():
+            # Workers write into a preallocated array, cached rows are copied in
+            cached = [d for d in data if d is not None]
+            if cached:
+                # Cached rows of different shapes cannot share a single output
+                shapes = {np.shape(d) for d in cached}
+                spec = (shapes.pop(), np.asarray(cached[0]).dtype) if len(shapes) == 1 else None
+            else:
+                spec = self.pipeline.get_output_spec([tasks[i] for i in missing])
+            if spec is not None:
+                output = self.pipeline.allocate_output(len(tasks), spec)
+            if output is not None:
+                for i, d in enumerate(data):
+                    if d is not None:
+                        output[i] = d
+        shard = []
+        failures = []
+        # Results whose shape differs from the shared output are sent back
+        sent = False
+        try:
+            # Checkpoint annotations in completion order
+            results = self.pipeline.imap_unordered(
+                [tasks[i] for i in missing],
+                output.filename if output is not None else None,
+                missing
+            )
+            for index, result in results:
+                if isinstance(result, Failure):
+                    failures.append(result._replace(index=missing[index]))
+                    continue
+                sent = sent or (output is not None and result is not None)
+                data[missing[index]] = result if result is not None else output[missing[index]]
+                shard.append(missing[index])
+                if len(shard) == shard_size:
+                    self._set_checkpoint(shard, keys, data, pipeline, cache)
+                    shard = []
+        finally:
+            # Checkpoint completed annotations even if preprocessing fails,
+            # a rerun resumes from the missing ones
+            if shard:
+                self._set_checkpoint(shard, keys, data, pipeline, cache)
+            if output is not None:
+                self.pipeline.release_output(output)
+        output = None if sent else output
+        data = data if output is None else output
+        if failures:
+            failures = sorted(failures)
+            failed = {failure.index for failure in failures}
+            if output is None:
+                data = [d for i, d in enumerate(data) if i not in failed]
+            else:
+                data = np.delete(data, sorted(failed), axis=0)
+        return data, failures
+
+    def _set_checkpoint(self, shard: List[int], keys: List[str], data: List, pipeline: str, cache: Cache) -> None:
+        logging.debug("Checkpoint %d preprocessed annotations", len(shard))
+        cache.set_many([keys[i] for i in shard], [data[i] for i in shard], pipeline)
+
+    def get_cache(self, cache_format: str = "pickle") -> Cache:
+        path = os.path.join(self.path, ".pyeeglab", "cache")
+        return Cache(path, cache_format, self.cache_max_size)
+
     def __hash__(self) -> int:
-        key = [self.path, self.version, self.minimum_annotation_duration]
+        key = [self.path, self.version, self.minimum_annotation_duration, self.header_only]
         key += self.exclude_file
         key += self.exclude_channels_set
         key += self.exclude_channels_reference
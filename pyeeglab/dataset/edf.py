@@ -0,0 +1,266 @@
+import os
+import re
+
+from dataclasses import dataclass
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from mne import create_info
+from mne.io import Raw, RawArray, read_raw
+
+# Physical dimensions scaled to volts, as MNE does
+UNITS = {"uV": 1e-6, "μV": 1e-6, "µV": 1e-6, "mV": 1e-3}
+
+# Time-stamped Annotations Lists (TAL) pattern of EDF+
+TAL = re.compile("([+-]\\d+\\.?\\d*)(\x15(\\d+\\.?\\d*))?(\x14.*?)\x14\x00")
+
+
+@dataclass
+class EDFHeader:
+    path: str
+    header_bytes: int
+    records: int
+    record_duration: float
+    labels: List[str]
+    units: List[str]
+    physical_min: np.ndarray
+    physical_max: np.ndarray
+    digital_min: np.ndarray
+    digital_max: np.ndarray
+    samples: np.ndarray
+
+    @classmethod
+    def read(cls, path: str) -> "EDFHeader":
+        # Read only the fixed-size header, i.e. 256 bytes plus 256 bytes per signal
+        with open(path, "rb") as reader:
+            header = reader.read(256)
+            header_bytes = int(header[184:192])
+            records = int(header[236:244])
+            record_duration = float(header[244:252])
+            signals = int(header[252:256])
+            header = reader.read(header_bytes - 256)
+
+        def fields(offset: int, size: int) -> Tuple[List[str], int]:
+            values = [
+                header[offset + i * size:offset + (i + 1) * size].decode("latin-1").strip()
+                for i in range(signals)
+            ]
+            return values, offset + signals * size
+
+        offset = 0
+        labels, offset = fields(offset, 16)
+        _, offset = fields(offset, 80)  # Transducer type
+        units, offset = fields(offset, 8)
+        physical_min, offset = fields(offset, 8)
+        physical_max, offset = fields(offset, 8)
+        digital_min, offset = fields(offset, 8)
+        digital_max, offset = fields(offset, 8)
+        _, offset = fields(offset, 80)  # Prefiltering
+        samples, offset = fields(offset, 8)
+
+        samples = np.array(samples, dtype=int)
+        # Infer the number of data records from file size,
+        # since it can be missing (-1) or wrong (interrupted recordings)
+        record_bytes = 2 * int(samples.sum())
+        if record_bytes > 0:
+            records = (os.path.getsize(path) - header_bytes) // record_bytes
+        return cls(
+            path=path,
+            header_bytes=header_bytes,
+            records=records,
+            record_duration=record_duration if record_duration > 0 else 1.0,
+            labels=labels,
+            units=units,
+            physical_min=np.array(physical_min, dtype=float),
+            physical_max=np.array(physical_max, dtype=float),
+            digital_min=np.array(digital_min, dtype=float),
+            digital_max=np.array(digital_max, dtype=float),
+            samples=samples,
+        )
+
+    @property
+    def signals(self) -> List[int]:
+        return [i for i, label in enumerate(self.labels) if label != "EDF Annotations"]
+
+    @property
+    def annotations_signals(self) -> List[int]:
+        return [i for i, label in enumerate(self.labels) if label == "EDF Annotations"]
+
+    @property
+    def ch_names(self) -> List[str]:
+        # Make duplicated channel names unique, as MNE does
+        labels = [self.labels[i] for i in self.signals]
+        duplicated = {label for label in labels if labels.count(label) > 1}
+        counters = {label: 0 for label in duplicated}
+        ch_names = []
+        for label in labels:
+            if label in duplicated:
+                ch_names.append("{}-{}".format(label, counters[label]))
+                counters[label] += 1
+            else:
+                ch_names.append(label)
+        return ch_names
+
+    @property
+    def sfreq(self) -> float:
+        samples = self.samples[self.signals]
+        return float(samples.max()) / self.record_duration if len(samples) else 0.0
+
+    @property
+    def n_times(self) -> int:
+        samples = self.samples[self.signals]
+        return int(self.records * samples.max()) if len(samples) else 0
+
+    @property
+    def info(self) -> Dict:
+        # Mimic the subset of mne.io.Raw.info used during indexing
+        return {"sfreq": self.sfreq, "ch_names": self.ch_names}
+
+    @property
+    def scales(self) -> np.ndarray:
+        return np.array([UNITS.get(self.units[i], 1.0) for i in self.signals])
+
+    @property
+    def physical_range(self) -> Tuple[float, float]:
+        signals = self.signals
+        if not signals:
+            return 0.0, 0.0
+        scales = self.scales
+        return (
+            float((self.physical_min[signals] * scales).min()),
+            float((self.physical_max[signals] * scales).max()),
+        )
+
+    @property
+    def annotations(self) -> List[Dict]:
+        # Read only the annotations signals bytes of each data record
+        signals = self.annotations_signals
+        if not signals:
+            return []
+        offsets = np.concatenate([[0], np.cumsum(2 * self.samples)])
+        record_bytes = int(offsets[-1])
+        tals = bytearray()
+        with open(self.path, "rb") as reader:
+            for record in range(self.records):
+                for signal in signals:
+                    reader.seek(self.header_bytes + record * record_bytes + int(offsets[signal]))
+                    tals.extend(reader.read(2 * int(self.samples[signal])))
+        return parse_tals(bytes(tals))
+
+
+def parse_tals(tals: bytes) -> List[Dict]:
+    annotations = []
+    offset = 0.0
+    for index, tal in enumerate(re.findall(TAL, tals.decode("latin-1"))):
+        onset = float(tal[0]) + offset
+        duration = float(tal[2]) if tal[2] else 0.0
+        for description in tal[3].split("\x14")[1:]:
+            if description:
+                annotations.append({
+                    "onset": onset,
+                    "duration": duration,
+                    "description": description,
+                })
+            elif index == 0:
+                # First time-keeping TAL marks the recording start
+                offset = -onset
+    return annotations
+
+
+class EDFReader():
+
+    def __init__(self, path: str) -> None:
+        self.header = EDFHeader.read(path)
+        offsets = np.concatenate([[0], np.cumsum(self.header.samples)])
+        self.offsets = offsets[:-1]
+        # Map data records lazily, decoding happens only on slicing
+        self.records = np.memmap(
+            path,
+            dtype="<i2",
+            mode="r",
+            offset=self.header.header_bytes,
+            shape=(self.header.records, int(offsets[-1])),
+        )
+        # Vectorized digital to physical scaling
+        signals = self.header.signals
+        calibration = self.header.physical_max - self.header.physical_min
+        digital = self.header.digital_max - self.header.digital_min
+        calibration /= np.where(digital == 0, 1, digital)
+        offset = self.header.physical_min - self.header.digital_min * calibration
+        self.calibration = calibration[signals] * self.header.scales
+        self.offset = offset[signals] * self.header.scales
+
+    @property
+    def ch_names(self) -> List[str]:
+        return self.header.ch_names
+
+    @property
+    def sfreq(self) -> float:
+        return self.header.sfreq
+
+    @property
+    def n_times(self) -> int:
+        return self.header.n_times
+
+    def is_uniform(self, channels: List[str] = None) -> bool:
+        # Channels sampled below the recording frequency must be resampled
+        samples = self.header.samples[self.header.signals][self._get_picks(channels)]
+        return bool(np.all(samples == self.header.samples[self.header.signals].max()))
+
+    def _get_picks(self, channels: List[str] = None) -> np.ndarray:
+        if channels is None:
+            return np.arange(len(self.ch_names))
+        channels = set(channels)
+        return np.array([i for i, name in enumerate(self.ch_names) if name in channels], dtype=int)
+
+    def get_data(self, start: int = 0, stop: int = None, channels: List[str] = None) -> np.ndarray:
+        picks = self._get_picks(channels)
+        stop = self.n_times if stop is None else min(stop, self.n_times)
+        samples = int(self.header.samples[self.header.signals].max())
+        # Decode only the data records covering [start, stop)
+        first, last = start // samples, -(-stop // samples)
+        columns = self.offsets[np.array(self.header.signals)[picks]]
+        columns = columns[:, np.newaxis] + np.arange(samples)
+        data = self.records[first:last][:, columns]
+        data = data.transpose(1, 0, 2).reshape(len(picks), -1)
+        data = data[:, start - first * samples:stop - first * samples]
+        data = data * self.calibration[picks, np.newaxis] + self.offset[picks, np.newaxis]
+        return data
+
+    def get_window(self, begin: float, end: float = None, channels: List[str] = None) -> Raw:
+        data = self.get_data(
+            int(round(begin * self.sfreq)),
+            int(round(end * self.sfreq)) + 1 if end is not None else None,
+            channels
+        )
+        picks = self._get_picks(channels)
+        info = create_info([self.ch_names[i] for i in picks], self.sfreq, "eeg")
+        return RawArray(data, info, verbose=False)
+
+
+def get_window_end(end: float, duration: float) -> float:
+    # Windows are clamped before the end of the recording
+    tmax = duration - 0.1
+    return tmax if end > tmax else end
+
+
+def get_window_samples(begin: float, end: float, sfreq: float, duration: float = None) -> int:
+    # Number of samples of the [begin, end] window read by read_window
+    end = get_window_end(end, duration) if duration is not None else end
+    return int(round(end * sfreq)) - int(round(begin * sfreq)) + 1
+
+
+def read_window(path: str, begin: float, end: float, channels: List[str] = None) -> Raw:
+    # Read [begin, end] window, optionally selecting a subset of channels
+    if os.path.splitext(path)[-1].lower() == ".edf":
+        reader = EDFReader(path)
+        if reader.is_uniform(channels):
+            tmax = get_window_end(end, reader.n_times / reader.sfreq)
+            return reader.get_window(begin, tmax, channels)
+    reader = read_raw(path)
+    tmax = get_window_end(end, reader.n_times / reader.info["sfreq"])
+    reader.crop(begin, tmax)
+    if channels is not None:
+        reader.pick_channels([name for name in reader.ch_names if name in set(channels)])
+    return reader.load_data()
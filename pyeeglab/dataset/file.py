@@ -1,6 +1,6 @@
 from dataclasses import dataclass
 from mne.io import Raw, read_raw
-from sqlalchemy import Column, Text
+from sqlalchemy import Column, Text, Float, Integer
 from sqlalchemy.orm import relationship
 from .declarative_base import Base
 
@@ -11,6 +11,9 @@ class File(Base):
     uuid: str = Column(Text, primary_key=True)
     path: str = Column(Text, nullable=False)
     extension: str = Column(Text, nullable=False)
+    size: int = Column(Integer, nullable=False)
+    mtime: float = Column(Float, nullable=False)
+    checksum: str = Column(Text, nullable=True)
 
     meta = relationship("Metadata", cascade="all,delete", backref="File")
     annotations = relationship("Annotation", cascade="all,delete", backref="File")
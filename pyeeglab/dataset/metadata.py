@@ -1,5 +1,5 @@
 from dataclasses import dataclass
-from sqlalchemy import Column, ForeignKey, Text, Float, Integer
+from sqlalchemy import Column, ForeignKey, Text, Float, Integer, Boolean
 from .declarative_base import Base
 
 
@@ -9,7 +9,9 @@ class Metadata(Base):
     file_uuid: str = Column(Text, ForeignKey("file.uuid"), primary_key=True)
     duration: int = Column(Float, nullable=False)
     channels_set: str = Column(Text, nullable=False, index=True)
+    channels_mask: str = Column(Text, nullable=False, index=True)
     channels_reference: str = Column(Text, nullable=True, index=True)
     sampling_frequency: int = Column(Integer, nullable=False, index=True)
     max_value: float = Column(Float, nullable=False)
     min_value: float = Column(Float, nullable=False)
+    signal_statistics: bool = Column(Boolean, nullable=False, default=True)
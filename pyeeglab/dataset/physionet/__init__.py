@@ -1,2 +1,6 @@
-from .chbmit_dataset import *
-from .eegmmidb_dataset import *
+from ...lazy import lazy_module
+
+__getattr__, __dir__, __all__ = lazy_module(__name__, {
+    "PhysioNetCHBMITDataset": ".chbmit_dataset",
+    "PhysioNetEEGMMIDBDataset": ".eegmmidb_dataset",
+})
@@ -5,6 +5,8 @@ from uuid import uuid4
 
 from typing import List
 
+from mne.io import Raw
+
 from .utils import wget
 
 from ..dataset import Dataset
@@ -32,6 +34,7 @@ class PhysioNetCHBMITDataset(Dataset):
                 "LUE-RAE",
                 "VNS",
             ],
+            **kwargs,
         ) -> None:
         super().__init__(
             path=path,
@@ -39,12 +42,13 @@ class PhysioNetCHBMITDataset(Dataset):
             version=version,
             exclude_file=exclude_file,
             exclude_channels_set=exclude_channels_set,
+            **kwargs,
         )
     
     def download(self, user: str = None, password: str = None) -> None:
         wget(self.path, user, password, "chbmit", self.version)
     
-    def _get_annotation(self, file: File) -> List[Annotation]:
+    def _get_annotation(self, file: File, reader: Raw) -> List[Annotation]:
         logging.debug("Add file %s annotations to index", file.uuid)
         annotations = [
             Annotation(
@@ -1,15 +1,8 @@
-import os
-import logging
-
-from uuid import uuid4
-
 from typing import List
 
 from .utils import wget
 
 from ..dataset import Dataset
-from ..file import File
-from ..annotation import Annotation
 
 
 class PhysioNetEEGMMIDBDataset(Dataset):
@@ -23,6 +16,7 @@ class PhysioNetEEGMMIDBDataset(Dataset):
                 "S104/S104R04.edf",     # Corrupted data
             ],
             exclude_sampling_frequency: List[int] = [ 128 ],
+            **kwargs,
         ) -> None:
         super().__init__(
             path=path,
@@ -30,35 +24,8 @@ class PhysioNetEEGMMIDBDataset(Dataset):
             version=version,
             exclude_file=exclude_file,
             exclude_sampling_frequency=exclude_sampling_frequency,
+            **kwargs,
         )
     
     def download(self, user: str = None, password: str = None) -> None:
         wget(self.path, user, password, "eegmmidb", self.version)
-    
-    def _get_annotation(self, file: File) -> List[Annotation]:
-        logging.debug("Add file %s annotations to index", file.uuid)
-        with file as reader:
-            try:
-                annotations = [
-                    Annotation(
-                        uuid=str(uuid4()),
-                        file_uuid=file.uuid,
-                        begin=annotation[0],
-                        end=annotation[0]+annotation[1],
-                        label=annotation[2],
-                    )
-                    for annotation in reader.annotations
-                ]
-            except KeyError:
-                # Alternative annotation format
-                annotations = [
-                    Annotation(
-                        uuid=str(uuid4()),
-                        file_uuid=file.uuid,
-                        begin=annotation["onset"],
-                        end=annotation["onset"]+annotation["duration"],
-                        label=annotation["description"],
-                    )
-                    for annotation in reader.annotations
-                ]
-        return annotations
@@ -0,0 +1,20 @@
+from typing import Dict
+
+import numpy as np
+
+
+def signal_statistics(reader, chunk_size: int = 1 << 20) -> Dict[str, np.ndarray]:
+    # Stream the recording in chunks of at most chunk_size values,
+    # so that memory usage does not depend on the recording length
+    channels = len(reader.ch_names)
+    step = max(chunk_size // max(channels, 1), 1)
+    minimum = np.full(channels, np.inf)
+    maximum = np.full(channels, -np.inf)
+    for start in range(0, reader.n_times, step):
+        data = reader.get_data(start=start, stop=min(start + step, reader.n_times))
+        np.minimum(minimum, data.min(axis=1), out=minimum)
+        np.maximum(maximum, data.max(axis=1), out=maximum)
+    return {
+        "min": minimum,
+        "max": maximum,
+    }
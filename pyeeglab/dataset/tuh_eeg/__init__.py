@@ -1,3 +1,7 @@
-from .abnormal_dataset import *
-from .artifact_dataset import *
-from .seizure_dataset import *
+from ...lazy import lazy_module
+
+__getattr__, __dir__, __all__ = lazy_module(__name__, {
+    "TUHEEGAbnormalDataset": ".abnormal_dataset",
+    "TUHEEGArtifactDataset": ".artifact_dataset",
+    "TUHEEGSeizureDataset": ".seizure_dataset",
+})
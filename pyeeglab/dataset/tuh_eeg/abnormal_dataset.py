@@ -5,6 +5,8 @@ from uuid import uuid4
 
 from typing import List
 
+from mne.io import Raw
+
 from .utils import rsync
 
 from ..dataset import Dataset
@@ -29,24 +31,26 @@ class TUHEEGAbnormalDataset(Dataset):
                 "STI 014",
                 "SUPPR"
             ],
+            **kwargs,
         ) -> None:
         super().__init__(
             path=path,
             name="Temple University Hospital EEG Abnormal Dataset",
             version="v"+version,
             exclude_channels_set=exclude_channels_set,
+            **kwargs,
         )
     
     def download(self, user: str = None, password: str = None) -> None:
         rsync(self.path, user, password, "tuh_eeg_abnormal", self.version)
 
-    def _get_metadata(self, file: File) -> Metadata:
+    def _get_metadata(self, file: File, reader: Raw) -> Metadata:
         meta = file.path.split(os.path.sep)
-        metadata = super()._get_metadata(file)
+        metadata = super()._get_metadata(file, reader)
         metadata.channels_reference = meta[-5]
         return metadata
     
-    def _get_annotation(self, file: File) -> List[Annotation]:
+    def _get_annotation(self, file: File, reader: Raw) -> List[Annotation]:
         logging.debug("Add file %s annotations to index", file.uuid)
         return [
             Annotation(
@@ -3,6 +3,8 @@ import logging
 
 from typing import List
 
+from mne.io import Raw
+
 from .utils import rsync, parse_tse
 
 from ..dataset import Dataset
@@ -28,6 +30,7 @@ class TUHEEGArtifactDataset(Dataset):
                 "02_tcp_le",
                 "03_tcp_ar_a"
             ],
+            **kwargs,
         ) -> None:
         super().__init__(
             path=path,
@@ -35,17 +38,18 @@ class TUHEEGArtifactDataset(Dataset):
             version="v"+version,
             exclude_channels_set=exclude_channels_set,
             exclude_channels_reference=exclude_channels_reference,
+            **kwargs,
         )
     
     def download(self, user: str = None, password: str = None) -> None:
         rsync(self.path, user, password, "tuh_eeg_artifact", self.version)
 
-    def _get_metadata(self, file: File) -> Metadata:
+    def _get_metadata(self, file: File, reader: Raw) -> Metadata:
         meta = file.path.split(os.path.sep)
-        metadata = super()._get_metadata(file)
+        metadata = super()._get_metadata(file, reader)
         metadata.channels_reference = meta[-5]
         return metadata
     
-    def _get_annotation(self, file: File) -> List[Annotation]:
+    def _get_annotation(self, file: File, reader: Raw) -> List[Annotation]:
         logging.debug("Add file %s annotations to index", file.uuid)
         return parse_tse(file)
@@ -6,6 +6,8 @@ from uuid import uuid4
 
 from typing import List
 
+from mne.io import Raw
+
 from .utils import rsync, parse_lbl
 
 from ..dataset import Dataset
@@ -34,6 +36,7 @@ class TUHEEGSeizureDataset(Dataset):
                 "02_tcp_le",
                 "03_tcp_ar_a"
             ],
+            **kwargs,
         ) -> None:
         super().__init__(
             path=path,
@@ -41,17 +44,18 @@ class TUHEEGSeizureDataset(Dataset):
             version="v"+version,
             exclude_channels_set=exclude_channels_set,
             exclude_channels_reference=exclude_channels_reference,
+            **kwargs,
         )
     
     def download(self, user: str = None, password: str = None) -> None:
         rsync(self.path, user, password, "tuh_eeg_seizure", self.version)
 
-    def _get_metadata(self, file: File) -> Metadata:
+    def _get_metadata(self, file: File, reader: Raw) -> Metadata:
         meta = file.path.split(os.path.sep)
-        metadata = super()._get_metadata(file)
+        metadata = super()._get_metadata(file, reader)
         metadata.channels_reference = meta[-5]
         return metadata
     
-    def _get_annotation(self, file: File) -> List[Annotation]:
+    def _get_annotation(self, file: File, reader: Raw) -> List[Annotation]:
         logging.debug("Add file %s annotations to index", file.uuid)
         return parse_lbl(file)
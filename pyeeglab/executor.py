@@ -0,0 +1,320 @@
+import os
+import sys
+import time
+import signal
+import logging
+
+from collections import deque
+from concurrent import futures
+from concurrent.futures.process import BrokenProcessPool
+from math import ceil
+from multiprocessing import cpu_count, get_context
+from multiprocessing.pool import Pool, ThreadPool
+from queue import Empty, Queue
+
+from typing import Any, Callable, Iterable, Iterator, List, Tuple
+
+# Executor backends, 'process' uses the platform default start method
+BACKENDS = ["serial", "thread", "process", "forkserver"]
+
+# concurrent.futures executors accept initializers and contexts since Python 3.7
+FUTURES = sys.version_info >= (3, 7)
+
+
+def get_n_jobs() -> int:
+    # CPUs actually available, honoring affinity masks and cgroup quotas
+    try:
+        n_jobs = len(os.sched_getaffinity(0))
+    except AttributeError:
+        n_jobs = cpu_count()
+    quota = _get_cgroup_quota()
+    if quota is not None:
+        n_jobs = min(n_jobs, max(1, ceil(quota)))
+    return n_jobs
+
+
+def _get_cgroup_quota() -> float:
+    try:
+        # cgroup v2, e.g. 'max 100000' or '200000 100000'
+        with open("/sys/fs/cgroup/cpu.max") as reader:
+            quota, period = reader.read().split()
+        return None if quota == "max" else int(quota) / int(period)
+    except (OSError, ValueError):
+        pass
+    try:
+        # cgroup v1, quota is -1 if unbounded
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as reader:
+            quota = int(reader.read())
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as reader:
+            period = int(reader.read())
+        return None if quota <= 0 or period <= 0 else quota / period
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def reorder(results: Iterator[Tuple[int, Any]]) -> Iterator:
+    # Yield results in order, reassembling (index, result) completions
+    buffer = {}
+    current = 0
+    for index, result in results:
+        buffer[index] = result
+        while current in buffer:
+            yield buffer.pop(current)
+            current += 1
+
+
+class _Indexed():
+    # Picklable wrapper returning results along with their task index
+
+    def __init__(self, function: Callable) -> None:
+        self.function = function
+
+    def __call__(self, item: Tuple[int, Any]) -> Tuple[int, Any]:
+        index, value = item
+        return index, self.function(value)
+
+
+class _Chunked(_Indexed):
+    # Run a chunk of tasks in a single call, as Pool.imap_unordered does
+
+    def __call__(self, items: List[Tuple[int, Any]]) -> List[Tuple[int, Any]]:
+        return [super(_Chunked, self).__call__(item) for item in items]
+
+
+# Started tasks queue of executors workers with timeout
+_started = None
+
+
+def _init_timed(started: Any, initializer: Callable, initargs: Tuple) -> None:
+    global _started
+    _started = started
+    if initializer is not None:
+        initializer(*initargs)
+
+
+class _Timed(_Indexed):
+    # Notify the parent the worker running a task, and when it can no longer be
+    # killed, i.e. it is sending back the result
+
+    def __call__(self, item: Tuple[int, Any]) -> Tuple[int, Any]:
+        _started.put((item[0], os.getpid()))
+        try:
+            return super().__call__(item)
+        finally:
+            _started.put((item[0], None))
+
+
+def _close_pool(pool: Any, terminate: bool = False) -> None:
+    if isinstance(pool, Pool):
+        if terminate:
+            pool.terminate()
+        else:
+            pool.close()
+        pool.join()
+    else:
+        pool.shutdown(wait=not terminate)
+
+
+class Executor():
+
+    def __init__(
+            self,
+            backend: str = "process",
+            n_jobs: int = None,
+            chunksize: int = None,
+            initializer: Callable = None,
+            initargs: Tuple = (),
+            timeout: float = None
+        ) -> None:
+        if backend not in BACKENDS:
+            raise ValueError("Unknown executor backend '{}', use one of {}".format(backend, BACKENDS))
+        self.backend = backend
+        # Negative values count backwards from the available CPUs, as joblib does
+        if n_jobs is None:
+            n_jobs = get_n_jobs()
+        elif n_jobs < 0:
+            n_jobs = max(1, get_n_jobs() + 1 + n_jobs)
+        self.n_jobs = n_jobs
+        self.chunksize = chunksize
+        self.initializer = initializer
+        self.initargs = initargs
+        # Per-task timeout in seconds, stuck workers are killed and replaced
+        self.timeout = timeout
+        self.pool = None
+
+    def __getstate__(self):
+        # Pools cannot be pickled, e.g. along with a dataset
+        state = self.__dict__.copy()
+        state["pool"] = None
+        return state
+
+    def with_initializer(self, initializer: Callable, initargs: Tuple = ()) -> "Executor":
+        # Same configuration with a different per-worker initializer
+        return Executor(self.backend, self.n_jobs, self.chunksize, initializer, initargs, self.timeout)
+
+    def _get_pool(self) -> Any:
+        # Processes pools are broken if a worker dies, e.g. killed by the OOM killer,
+        # instead of waiting forever for its tasks as multiprocessing pools do
+        logging.debug("Open %s executor with %d jobs", self.backend, self.n_jobs)
+        if not FUTURES:
+            # Python 3.6 falls back to multiprocessing pools, dead workers are not detected
+            if self.backend == "thread":
+                return ThreadPool(self.n_jobs, self.initializer, self.initargs)
+            context = get_context("forkserver" if self.backend == "forkserver" else None)
+            return context.Pool(self.n_jobs, self.initializer, self.initargs)
+        if self.backend == "thread":
+            return futures.ThreadPoolExecutor(self.n_jobs, initializer=self.initializer, initargs=self.initargs)
+        context = get_context("forkserver") if self.backend == "forkserver" else None
+        return futures.ProcessPoolExecutor(self.n_jobs, context, self.initializer, self.initargs)
+
+    def _get_chunksize(self, size: int) -> int:
+        if self.chunksize is not None:
+            return self.chunksize
+        # Same heuristic of Pool.map
+        chunksize, extra = divmod(size, self.n_jobs * 4)
+        return max(1, chunksize + bool(extra))
+
+    def __enter__(self) -> "Executor":
+        # Keep the pool open across multiple calls
+        if self.backend != "serial":
+            self.pool = self._get_pool()
+        elif self.initializer is not None:
+            self.initializer(*self.initargs)
+        return self
+
+    def __exit__(self, *args, **kwargs) -> None:
+        if self.pool is not None:
+            _close_pool(self.pool)
+            self.pool = None
+
+    def imap_unordered(self, function: Callable, iterable: Iterable) -> Iterator[Tuple[int, Any]]:
+        # Yield (index, result) pairs as soon as tasks complete
+        items = list(enumerate(iterable))
+        if not items:
+            return
+        if self.timeout is not None and self.backend in ("serial", "thread"):
+            # Threads cannot be killed, stuck tasks cannot be recycled
+            logging.warning("Timeout is not supported by the %s executor, ignored", self.backend)
+        elif self.timeout is not None:
+            yield from self._imap_timeout(function, items)
+            return
+        if self.backend == "serial":
+            if self.pool is None and self.initializer is not None:
+                self.initializer(*self.initargs)
+            yield from map(_Indexed(function), items)
+            return
+        pool = self.pool if self.pool is not None else self._get_pool()
+        chunksize = self._get_chunksize(len(items))
+        if isinstance(pool, Pool):
+            yield from self._imap_pool(pool, function, items, chunksize)
+            return
+        chunks = deque(items[i:i + chunksize] for i in range(0, len(items), chunksize))
+        running = set()
+        try:
+            while chunks or running:
+                # Keep a bounded number of chunks in flight, completed ones are released
+                while chunks and len(running) < 2 * self.n_jobs:
+                    running.add(pool.submit(_Chunked(function), chunks.popleft()))
+                done, running = futures.wait(running, return_when=futures.FIRST_COMPLETED)
+                # Yield the completed chunks before raising errors of the failed ones
+                for future in sorted(done, key=lambda future: future.exception() is not None):
+                    yield from future.result()
+        except BaseException as error:
+            if isinstance(error, BrokenProcessPool):
+                logging.error("A %s executor worker terminated abruptly, abort pending tasks", self.backend)
+            # Drop pending tasks, the pool cannot be reused
+            for future in running:
+                future.cancel()
+            pool.shutdown(wait=False)
+            if pool is self.pool:
+                self.pool = None
+            raise
+        if pool is not self.pool:
+            pool.shutdown()
+
+    def _imap_pool(self, pool: Pool, function: Callable, items: List[Tuple[int, Any]], chunksize: int) -> Iterator[Tuple[int, Any]]:
+        try:
+            yield from pool.imap_unordered(_Indexed(function), items, chunksize)
+        except BaseException:
+            # Drop pending tasks, the pool cannot be reused
+            _close_pool(pool, terminate=True)
+            if pool is self.pool:
+                self.pool = None
+            raise
+        if pool is not self.pool:
+            _close_pool(pool)
+
+    def _get_timed_pool(self) -> Tuple[Any, Any]:
+        # Workers notify started tasks, so timeouts do not count queueing and startup
+        context = get_context("forkserver" if self.backend == "forkserver" else None)
+        started = context.SimpleQueue()
+        pool = context.Pool(self.n_jobs, _init_timed, (started, self.initializer, self.initargs))
+        return pool, started
+
+    def _imap_timeout(self, function: Callable, items: List[Tuple[int, Any]]) -> Iterator[Tuple[int, Any]]:
+        # Keep at most one task per worker in flight, timed out tasks yield a TimeoutError
+        # and only their worker is killed, the pool replaces it, a dedicated pool
+        # is used since workers must notify started tasks
+        pending = deque(items)
+        running = {}
+        completed = Queue()
+        killed = False
+        pool, started = self._get_timed_pool()
+        try:
+            while pending or running:
+                while pending and len(running) < self.n_jobs:
+                    index, value = pending.popleft()
+                    pool.apply_async(
+                        _Timed(function),
+                        ((index, value), ),
+                        callback=completed.put,
+                        error_callback=lambda error, index=index: completed.put((index, error))
+                    )
+                    # Deadline and worker pid, once started
+                    running[index] = [None, None]
+                # Poll completions, starts and deadlines
+                try:
+                    index, result = completed.get(timeout=0.1)
+                except Empty:
+                    index, result = None, None
+                if index in running:
+                    del running[index]
+                    if isinstance(result, BaseException):
+                        raise result
+                    yield index, result
+                while not started.empty():
+                    index, pid = started.get()
+                    if index in running:
+                        running[index] = [time.monotonic() + self.timeout, pid] if pid is not None else [None, None]
+                now = time.monotonic()
+                expired = [i for i, (deadline, _) in running.items() if deadline is not None and deadline <= now]
+                for index in expired:
+                    _, pid = running.pop(index)
+                    logging.warning("Task %d timed out after %s seconds, kill worker %d", index, self.timeout, pid)
+                    self._kill(pid)
+                    killed = True
+                    yield index, TimeoutError("Task timed out after {} seconds".format(self.timeout))
+        except BaseException:
+            pool.terminate()
+            pool.join()
+            raise
+        # Tasks of killed workers never complete, closing would wait for them
+        if killed:
+            pool.terminate()
+        else:
+            pool.close()
+        pool.join()
+
+    def _kill(self, pid: int) -> None:
+        try:
+            os.kill(pid, getattr(signal, "SIGKILL", signal.SIGTERM))
+        except OSError:
+            # Already exited
+            pass
+
+    def imap(self, function: Callable, iterable: Iterable) -> Iterator:
+        yield from reorder(self.imap_unordered(function, iterable))
+
+    def map(self, function: Callable, iterable: Iterable) -> List:
+        return list(self.imap(function, iterable))
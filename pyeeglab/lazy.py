@@ -0,0 +1,27 @@
+import sys
+
+from importlib import import_module
+from typing import Callable, Dict, List, Tuple
+
+
+def lazy_module(name: str, attributes: Dict[str, str]) -> Tuple[Callable, Callable, List[str]]:
+    # Import the module defining an attribute only on first access (PEP 562),
+    # so heavy dependencies are loaded only when actually needed
+    module = sys.modules[name]
+
+    def __getattr__(attribute: str):
+        if attribute not in attributes:
+            raise AttributeError("module '{}' has no attribute '{}'".format(name, attribute))
+        value = getattr(import_module(attributes[attribute], name), attribute)
+        setattr(module, attribute, value)
+        return value
+
+    def __dir__() -> List[str]:
+        return sorted(set(vars(module)) | set(attributes))
+
+    # Module level __getattr__ is not supported before Python 3.7
+    if sys.version_info < (3, 7):
+        for attribute in attributes:
+            __getattr__(attribute)
+
+    return __getattr__, __dir__, sorted(attributes)
@@ -1,2 +1,11 @@
-from .pipeline import Pipeline
-from .preprocessor import Preprocessor, ForkedPreprocessor
+from ..lazy import lazy_module
+
+__getattr__, __dir__, __all__ = lazy_module(__name__, {
+    "Pipeline": ".pipeline",
+    "Preprocessor": ".preprocessor",
+    "ForkedPreprocessor": ".preprocessor",
+    "Task": ".task",
+    "Failure": ".task",
+    "Profiler": ".profiler",
+    "EEGArray": ".eeg_array",
+})
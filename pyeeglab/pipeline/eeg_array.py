@@ -0,0 +1,69 @@
+from dataclasses import dataclass, replace
+from typing import List, Union
+
+import numpy as np
+import pandas as pd
+
+from mne.defaults import DEFAULTS
+from mne.io import Raw
+
+
+@dataclass(eq=False)
+class EEGArray():
+    # Lightweight ndarray-backed signal, channels along the second to last axis and
+    # time samples along the last one (features, if named), windows along the first
+    data: np.ndarray
+    ch_names: List[str]
+    sfreq: float
+    features: List[str] = None
+
+    @classmethod
+    def from_raw(cls, raw: Raw) -> 'EEGArray':
+        # Scale channels by type as mne.io.Raw.to_data_frame does, e.g. EEG to microvolts
+        data = raw.get_data()
+        types = np.array(raw.get_channel_types())
+        for kind, scaling in DEFAULTS['scalings'].items():
+            data[types == kind] *= scaling
+        return cls(data, list(raw.ch_names), raw.info['sfreq'])
+
+    @property
+    def n_times(self) -> int:
+        return self.data.shape[-1]
+
+    @property
+    def is_windowed(self) -> bool:
+        return self.data.ndim > 2
+
+    def get_windows(self, starts: range, length: int) -> 'EEGArray':
+        # Zero-copy strided view of equally spaced windows along the time axis
+        if self.is_windowed or self.features is not None:
+            raise ValueError('Windows can be extracted from signals only')
+        if len(starts) and starts[-1] + length > self.n_times:
+            raise RuntimeError('Error while creating frames: not enough data.')
+        data = self.data[:, starts.start:]
+        data = np.lib.stride_tricks.as_strided(
+            data,
+            shape=(len(starts), data.shape[0], length),
+            strides=(data.strides[1] * starts.step, data.strides[0], data.strides[1]),
+            writeable=False
+        )
+        return replace(self, data=data)
+
+    def to_features(self, features: Union[str, List[str]], data: np.ndarray) -> 'EEGArray':
+        # Per-channel features, a single one is computed reducing the time axis
+        if isinstance(features, str):
+            features, data = [features], data[..., np.newaxis]
+        return replace(self, data=data, features=features)
+
+    def to_numpy(self, dtype: str = None) -> np.ndarray:
+        # Same layout of the DataFrames, i.e. samples by channels or channels by features
+        data = self.data if self.features is not None else np.swapaxes(self.data, -1, -2)
+        return data.astype(dtype) if dtype is not None else data
+
+    def to_dataframe(self) -> Union[pd.DataFrame, List[pd.DataFrame]]:
+        # Windowed arrays are converted to lists of frames
+        if self.is_windowed:
+            return [replace(self, data=data).to_dataframe() for data in self.data]
+        if self.features is not None:
+            return pd.DataFrame(self.data, index=self.ch_names, columns=self.features)
+        return pd.DataFrame(self.data.T, columns=self.ch_names)
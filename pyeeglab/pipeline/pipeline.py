@@ -1,16 +1,104 @@
+import os
 import json
+import shutil
 import logging
+import time
+import tempfile
+import traceback
+import weakref
 
 from hashlib import md5
 from os.path import join
-from multiprocessing import Pool, cpu_count
 
-from typing import Dict, List
+from typing import Dict, Iterator, List, Tuple
 
 import numpy as np
 import pandas as pd
 
+from mne import create_info
+from mne.io import RawArray
+
+from ..cache import Cache
+from ..executor import Executor, reorder
+from .eeg_array import EEGArray
 from .preprocessor import Preprocessor
+from .profiler import Profiler
+from .task import Failure, Task
+
+# Failed tasks policies, after retries are exhausted
+ERRORS = ['raise', 'skip']
+
+# Pipeline installed once per worker process
+_worker = None
+
+
+def _init_worker(pipeline: 'Pipeline', environment: Dict) -> None:
+    global _worker
+    _worker = (pipeline, environment)
+
+
+def _write_output(path: str, rows: List[int], results: List) -> List:
+    # Write results in place at their rows, only results whose shape differs
+    # from the output are sent back, the map is dropped on return so no
+    # mapping of unlinked outputs is kept alive
+    output = np.lib.format.open_memmap(path, mode='r+')
+    sent = []
+    for row, result in zip(rows, results):
+        if np.shape(result) != output.shape[1:]:
+            sent.append(result)
+            continue
+        output[row] = result
+        sent.append(None)
+    return sent
+
+
+def _remove_output(path: str) -> None:
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def _get_result(task: Task, path: str, row: int):
+    pipeline, environment = _worker
+    try:
+        result = pipeline._trigger_pipeline(task, environment)
+        if path is not None:
+            result, = _write_output(path, [row], [result])
+    except Exception as error:
+        if not pipeline.is_tolerant():
+            raise
+        # Report the failure instead of aborting the whole run
+        result = Failure.from_task(task, error, traceback.format_exc())
+    return result
+
+
+def _get_measured(result):
+    # Ship the task measures back along with its result
+    pipeline, _ = _worker
+    if pipeline.profiler is not None:
+        result = (result, pipeline.profiler.pop())
+    return result
+
+
+def _run_task(item: Tuple[Task, str, int]):
+    task, path, row = item
+    return _get_measured(_get_result(task, path, row))
+
+
+def _run_group(item: Tuple[List[Task], str, List[int]]) -> List:
+    tasks, path, rows = item
+    pipeline, environment = _worker
+    try:
+        results = pipeline._trigger_group(tasks, environment)
+        if path is not None:
+            results = _write_output(path, rows, results)
+    except Exception:
+        if not pipeline.is_tolerant():
+            raise
+        # Run the file tasks one by one, so a bad window does not fail the others
+        results = [_get_result(task, path, row) for task, row in zip(tasks, rows)]
+    return _get_measured(results)
 
 
 class Pipeline():
@@ -18,10 +106,72 @@ class Pipeline():
     environment: Dict = {}
     pipeline: List[Preprocessor]
 
-    def __init__(self, preprocessors: List[Preprocessor] = [], labels_mapping: Dict = None) -> None:
+    def __init__(
+            self,
+            preprocessors: List[Preprocessor] = [],
+            labels_mapping: Dict = None,
+            cache: str = None,
+            cache_stages: List[int] = None,
+            cache_max_size: int = None,
+            executor: Executor = None,
+            group_by_file: bool = False,
+            longest_first: bool = True,
+            shared_output: bool = False,
+            shared_output_dir: str = None,
+            errors: str = 'raise',
+            retries: int = 0,
+            timeout: float = None,
+            profile: bool = False,
+            profile_memory: bool = False
+        ) -> None:
         logging.debug('Create new preprocessing pipeline')
         self.pipeline = preprocessors
         self.labels_mapping = labels_mapping
+        self.executor = executor if executor is not None else Executor()
+        # Decode each recording once, running file level stages on it
+        self.group_by_file = group_by_file
+        # Dispatch longest tasks first, so short ones fill the tail
+        self.longest_first = longest_first
+        # Workers write numpy outputs into a single file backed memory map
+        self.shared_output = shared_output
+        self.shared_output_dir = shared_output_dir
+        # Failed tasks are retried, then either raised or skipped and reported
+        if errors not in ERRORS:
+            raise ValueError('Unknown errors policy \'{}\', use one of {}'.format(errors, ERRORS))
+        self.errors = errors
+        self.retries = retries
+        # Per-task timeout in seconds, stuck workers are killed and replaced
+        self.timeout = timeout
+        self.failures = []
+        # Measure wall time, CPU time and output size of each stage, optionally peak RSS
+        self.profiler = Profiler(profile_memory) if profile or profile_memory else None
+        # Persist the outputs of the given intermediate stages, none by default
+        # since each one stores a copy of the data set per annotation
+        self.cache = cache
+        if cache_stages is None:
+            cache_stages = []
+        self.cache_stages = sorted(set(cache_stages))
+        self.cache_max_size = cache_max_size
+        # Prefix cache opened once per process, on first use
+        self._cache = None
+        # Executor kept open across runs by 'with pipeline'
+        self._executor = None
+
+    def __enter__(self) -> 'Pipeline':
+        # Keep the workers pool open across multiple runs, e.g. batches
+        self._executor = self._get_executor().__enter__()
+        return self
+
+    def __exit__(self, *args, **kwargs) -> None:
+        executor, self._executor = self._executor, None
+        executor.__exit__(*args, **kwargs)
+
+    def __getstate__(self):
+        # Workers do not need the parent executor, and open their own cache
+        state = self.__dict__.copy()
+        state['_executor'] = None
+        state['_cache'] = None
+        return state
     
     def _check_nans(self, data):
         nans = False
@@ -29,15 +179,82 @@ class Pipeline():
             nans = np.any(np.isnan(data))
         if isinstance(data, pd.DataFrame):
             nans = data.isnull().values.any()
+        if isinstance(data, EEGArray):
+            nans = np.any(np.isnan(data.data))
         return nans
 
-    def _trigger_pipeline(self, annotation, kwargs):
-        data = None
+    def _get_channels(self, kwargs) -> List[str]:
+        # Read only the common channels set if it is selected first
+        if self.pipeline and self.pipeline[0].__class__.__name__ == 'CommonChannelSet':
+            return kwargs.get('channels_set')
+        return None
+
+    def _get_prefix_json(self, stages: int) -> str:
+        return '[ ' + ', '.join([p.to_json() for p in self.pipeline[:stages]]) + ' ]'
+
+    def get_environment(self, environment: Dict = None, stages: int = None) -> Dict:
+        # Environment entries read by the first stages, so outputs are not
+        # invalidated by data set wide changes they do not depend on
+        environment = self.environment if environment is None else environment
+        keys = set()
+        for preprocessor in self.pipeline[:stages]:
+            if preprocessor.environment_keys is None:
+                return dict(environment)
+            keys.update(preprocessor.environment_keys)
+        return {key: value for key, value in environment.items() if key in keys}
+
+    def _get_prefix_key(self, task: Task, kwargs, stages: int) -> str:
+        # Key of the annotation output after the first stages of the pipeline
+        key = [p.to_json() for p in self.pipeline[:stages]]
+        key = [task.fingerprint, key, self.get_environment(kwargs, stages)]
+        # File level stages output differs from the windowed one
+        if self.group_by_file:
+            key.append('group_by_file')
+        key = json.dumps(key, sort_keys=True, default=str).encode()
+        return md5(key).hexdigest()
+
+    def _get_prefix(self, task: Task, kwargs, cache: Cache):
+        # Resume from the longest cached prefix of the pipeline
+        for stage in reversed(self.cache_stages):
+            data = cache.get(self._get_prefix_key(task, kwargs, stage + 1))
+            if data is not None:
+                return data, stage + 1
+        return None, 0
 
-        with annotation as reader:
-            data = reader.load_data()
-            for preprocessor in self.pipeline:
-                data = preprocessor.run(data, **kwargs)
+    def _get_cache(self) -> Cache:
+        if self.cache is None:
+            return None
+        # Opening a cache creates its directory and manifest, do it once per process
+        if self._cache is None or self._cache.path != self.cache:
+            self._cache = Cache(self.cache, max_size=self.cache_max_size)
+        return self._cache
+
+    def _read(self, task: Task, kwargs):
+        if self.profiler is None:
+            return task.read(self._get_channels(kwargs))
+        return self.profiler.measure(-1, 'Read', task, task.read, self._get_channels(kwargs))
+
+    def _run_stage(self, stage: int, task: Task, data, kwargs):
+        preprocessor = self.pipeline[stage]
+        if self.profiler is None:
+            return preprocessor.run(data, **kwargs)
+        name = preprocessor.__class__.__name__
+        return self.profiler.measure(stage, name, task, preprocessor.run, data, **kwargs)
+
+    def _trigger_pipeline(self, task: Task, kwargs, data=None, start: int = 0):
+        cache = self._get_cache()
+        if data is None and cache is not None:
+            data, start = self._get_prefix(task, kwargs, cache)
+        if data is None:
+            data = self._read(task, kwargs)
+        for stage in range(start, len(self.pipeline)):
+            data = self._run_stage(stage, task, data, kwargs)
+            if cache is not None and stage in self.cache_stages:
+                cache.set(
+                    self._get_prefix_key(task, kwargs, stage + 1),
+                    data,
+                    self._get_prefix_json(stage + 1)
+                )
         
         nans = False
         if isinstance(data, list):
@@ -45,20 +262,311 @@ class Pipeline():
         else:
             nans = self._check_nans(data)
         if nans:
-            raise ValueError('Nans found in file with id {}'.format(annotation.file_uuid))
+            raise ValueError('Nans found in file with id {}'.format(task.file_uuid))
 
         return data
 
-    def run(self, data) -> Dict:
+    def _get_file_stages(self) -> int:
+        # Number of leading file level stages
+        stages = 0
+        while stages < len(self.pipeline) and self.pipeline[stages].file_level:
+            stages += 1
+        return stages
+
+    def _trigger_group(self, tasks: List[Task], kwargs) -> List:
+        # Run file level stages once on the span covering all the tasks of a file,
+        # then slice each annotation window out of it
+        stages = self._get_file_stages()
+        cache = self._get_cache()
+        results = [None] * len(tasks)
+        pending = []
+        for i, task in enumerate(tasks):
+            data, start = None, 0
+            if cache is not None:
+                data, start = self._get_prefix(task, kwargs, cache)
+            if data is not None and start >= stages:
+                results[i] = self._trigger_pipeline(task, kwargs, data, start)
+            else:
+                pending.append(i)
+        if pending:
+            begin = min(tasks[i].begin for i in pending)
+            end = max(tasks[i].end for i in pending)
+            task = tasks[pending[0]]._replace(begin=begin, end=end)
+            span = self._read(task, kwargs)
+            for stage in range(stages):
+                span = self._run_stage(stage, task, span, kwargs)
+            for i in pending:
+                tmin = tasks[i].begin - begin
+                tmax = min(tasks[i].end - begin, span.times[-1])
+                data = self._get_window(span, tmin, tmax)
+                results[i] = self._trigger_pipeline(tasks[i], kwargs, data, stages)
+        return results
+
+    def _get_window(self, span, tmin: float, tmax: float) -> RawArray:
+        # Same samples of span.copy().crop(tmin, tmax), copying only the window
+        sfreq = span.info['sfreq']
+        start, stop = int(round(tmin * sfreq)), int(round(tmax * sfreq)) + 1
+        return RawArray(span.get_data(start=start, stop=stop), span.info, verbose=False)
+
+    def _get_groups(self, tasks: List[Task]) -> List[List[int]]:
+        # Group tasks indexes by recording, preserving their order
+        groups = {}
+        for i, task in enumerate(tasks):
+            groups.setdefault(task.path, []).append(i)
+        return list(groups.values())
+
+    def _get_task(self, data) -> Task:
+        if isinstance(data, Task):
+            return data
+        return Task.from_annotation(data)
+
+    def _get_executor(self) -> Executor:
+        if self._executor is not None:
+            return self._executor
         logging.debug('Environment variables: {}'.format(
             str(self.environment)
         ))
-        labels = [raw.label for raw in data]
-        data = [(d, self.environment) for d in data]
-        pool = Pool(cpu_count())
-        data = pool.starmap(self._trigger_pipeline, data)
-        pool.close()
-        pool.join()
+        # Ship the pipeline once per worker, tasks are plain records
+        executor = self.executor.with_initializer(_init_worker, (self, self.environment))
+        # Chunks of sorted tasks would pile the longest ones on a single worker
+        if self.longest_first and executor.chunksize is None:
+            executor.chunksize = 1
+        if self.timeout is not None:
+            executor.timeout = self.timeout
+        return executor
+
+    def is_tolerant(self) -> bool:
+        return self.errors != 'raise' or self.retries > 0
+
+    def imap(self, data: List) -> Iterator:
+        # Yield results in order as soon as they are completed, skipping failures
+        for result in reorder(self.imap_unordered(data)):
+            if not isinstance(result, Failure):
+                yield result
+
+    def _get_cost(self, tasks: List[Task]) -> float:
+        # Estimate processing cost by the samples to decode
+        begin = min(task.begin for task in tasks)
+        end = max(task.end for task in tasks)
+        return (end - begin) * (tasks[0].sfreq or 1)
+
+    def imap_unordered(self, data: List, output: str = None, rows: List[int] = None) -> Iterator[Tuple[int, object]]:
+        # Yield (index, result) pairs in completion order, if an output memory map
+        # is given results are written in place at their rows and yielded as None,
+        # skipped tasks yield their Failure report, also collected in 'failures'
+        data = [self._get_task(d) for d in data]
+        rows = list(range(len(data))) if rows is None else rows
+        self.failures = []
+        attempts = [0] * len(data)
+        pending = list(range(len(data)))
+        start = time.perf_counter()
+        try:
+            yield from self._imap_retry(data, pending, attempts, output, rows)
+        finally:
+            if self.profiler is not None:
+                self.profiler.add_elapsed(time.perf_counter() - start)
+
+    def _imap_retry(self, data: List[Task], pending: List[int], attempts: List[int], output: str, rows: List[int]) -> Iterator[Tuple[int, object]]:
+        while pending:
+            failed = []
+            for index, result in self._imap_attempt(data, pending, output, rows):
+                attempts[index] += 1
+                if isinstance(result, BaseException):
+                    result = Failure.from_task(data[index], result)
+                if not isinstance(result, Failure):
+                    yield index, result
+                    continue
+                if attempts[index] <= self.retries:
+                    failed.append(index)
+                    continue
+                result = result._replace(index=index, attempts=attempts[index])
+                if self.errors == 'raise':
+                    raise RuntimeError('Annotation {} of file {} failed after {} attempts: {}'.format(
+                        index, result.file_uuid, result.attempts, result.error
+                    ))
+                logging.warning('Skip annotation %d of file %s: %s', index, result.file_uuid, result.error)
+                self.failures.append(result)
+                yield index, result
+            if failed:
+                logging.info('Retry %d failed annotations', len(failed))
+            pending = sorted(failed)
+
+    def _imap_attempt(self, data: List[Task], indexes: List[int], output: str, rows: List[int]) -> Iterator[Tuple[int, object]]:
+        if self.group_by_file:
+            groups = self._get_groups([data[i] for i in indexes])
+            groups = [[indexes[i] for i in group] for group in groups]
+        else:
+            groups = [[i] for i in indexes]
+        # Longest processing time first order, idle workers pull the next longest task
+        order = list(range(len(groups)))
+        if self.longest_first:
+            costs = [self._get_cost([data[i] for i in group]) for group in groups]
+            order = sorted(order, key=lambda i: costs[i], reverse=True)
+        executor = self._get_executor()
+        if self.group_by_file:
+            results = executor.imap_unordered(_run_group, [
+                ([data[i] for i in groups[j]], output, [rows[i] for i in groups[j]])
+                for j in order
+            ])
+            for index, result in results:
+                group = groups[order[index]]
+                # Timed out groups fail all their tasks
+                if isinstance(result, BaseException):
+                    result = [result] * len(group)
+                else:
+                    result = self._add_measures(result)
+                yield from zip(group, result)
+        else:
+            results = executor.imap_unordered(_run_task, [(data[groups[j][0]], output, rows[groups[j][0]]) for j in order])
+            for index, result in results:
+                if not isinstance(result, BaseException):
+                    result = self._add_measures(result)
+                yield groups[order[index]][0], result
+
+    def _add_measures(self, result):
+        # Collect the measures shipped back by the workers
+        if self.profiler is None:
+            return result
+        result, records = result
+        self.profiler.add(records)
+        return result
+
+    def is_numpy(self) -> bool:
+        return any([p.__class__.__name__ == 'ToNumpy' for p in self.pipeline])
+
+    def infer_output_spec(
+            self,
+            environment: Dict = None,
+            duration: float = 1.0,
+            sfreq: float = None,
+            channels: List[str] = None,
+            samples: int = None
+        ) -> Tuple[Tuple[int], np.dtype]:
+        # Dry-run the pipeline on a synthetic recording of given duration,
+        # or of given number of samples, e.g. of a window clamped by read_window
+        environment = self.environment if environment is None else environment
+        channels = channels if channels else environment.get('channels_set', ['EEG'])
+        sfreq = sfreq if sfreq else environment.get('lowest_frequency', 256)
+        samples = samples if samples else int(round(duration * sfreq)) + 1
+        # Random signal in the data set range, constant ones yield NaN features
+        low = environment.get('min_value', -1e-4)
+        high = environment.get('max_value', 1e-4)
+        data = np.random.RandomState(0).uniform(low, high, (len(channels), samples))
+        data = RawArray(data, create_info(list(channels), sfreq, 'eeg'), verbose=False)
+        for preprocessor in self.pipeline:
+            data = preprocessor.run(data, **environment)
+        data = np.asarray(self.encode_data(data))
+        return data.shape, data.dtype
+
+    def get_output_spec(self, data: List) -> Tuple[Tuple[int], np.dtype]:
+        # Read channels are known only if the common channels set is selected first,
+        # otherwise None and the spec is taken from the first result of the workers
+        channels = self._get_channels(self.environment)
+        if channels is None:
+            return None
+        tasks = [self._get_task(d) for d in data]
+        # Samples read are unknown without the tasks sampling frequency
+        if any(task.sfreq is None for task in tasks):
+            return None
+        # Probe the samples actually read, i.e. with the same rounding and
+        # end of recording clamp of read_window, at the tasks frequency
+        probes = [(task.get_samples(), task.sfreq) for task in tasks]
+        # Outputs do not shrink with longer or denser recordings, so the spec is
+        # shared by all the tasks only if the shortest and longest ones agree
+        probes = {
+            min(probes), max(probes),
+            min(probes, key=lambda probe: probe[::-1]),
+            max(probes, key=lambda probe: probe[::-1]),
+        }
+        try:
+            specs = [
+                self.infer_output_spec(self.environment, sfreq=sfreq, channels=channels, samples=samples)
+                for samples, sfreq in sorted(probes)
+            ]
+        except Exception as error:
+            logging.debug('Output spec inference failed: %s', error)
+            return None
+        if len(set(specs)) > 1:
+            logging.debug('Output spec depends on tasks durations: %s', specs)
+            return None
+        return specs[0]
+
+    def _get_output_dir(self, size: int) -> str:
+        # Prefer shared memory file system if it has room for the output, writing
+        # past the end of a full tmpfs raises SIGBUS in the workers instead of an error
+        if self.shared_output_dir is not None:
+            directories = [self.shared_output_dir]
+        else:
+            directories = ['/dev/shm', tempfile.gettempdir()]
+        for directory in directories:
+            if os.path.isdir(directory) and shutil.disk_usage(directory).free >= size:
+                return directory
+        return None
+
+    def allocate_output(self, size: int, spec: Tuple[Tuple[int], np.dtype]) -> np.memmap:
+        # Preallocate a file backed output shared with the workers,
+        # None if there is no room for it
+        shape, dtype = spec
+        nbytes = size * int(np.prod(shape)) * np.dtype(dtype).itemsize
+        directory = self._get_output_dir(nbytes)
+        if directory is None:
+            logging.warning('No room for a shared output of %d bytes, results are sent back', nbytes)
+            return None
+        descriptor, path = tempfile.mkstemp(prefix='pyeeglab', suffix='.npy', dir=directory)
+        os.close(descriptor)
+        return np.lib.format.open_memmap(path, mode='w+', dtype=dtype, shape=(size, ) + tuple(shape))
+
+    def release_output(self, output: np.memmap) -> None:
+        # Unlink the backing file, the mapping stays valid until dereferenced,
+        # mapped files cannot be removed on Windows, remove it once unmapped
+        if os.name == 'nt':
+            weakref.finalize(output._mmap, _remove_output, output.filename)
+        else:
+            _remove_output(output.filename)
+
+    def transform(self, data: List) -> List:
+        if not (self.is_numpy() and data):
+            return list(self.imap(data))
+        # Output spec is probed only to share the output with the workers,
+        # otherwise the output is allocated from the first result
+        spec = self.get_output_spec(data) if self.shared_output else None
+        output = self.allocate_output(len(data), spec) if spec is not None else None
+        if output is None:
+            return self._collect_output(len(data), self.imap_unordered(data))
+        try:
+            return self._collect_output(len(data), self.imap_unordered(data, output.filename), output)
+        finally:
+            self.release_output(output)
+
+    def _collect_output(self, size: int, results: Iterator[Tuple[int, object]], shared: np.memmap = None) -> List:
+        # Allocate once from the first result and fill results as they complete,
+        # on a shape mismatch, e.g. of windows clamped at the end of recording,
+        # results are kept as they are instead of being broadcast into the output.
+        # Results written in place by the workers into the shared output are None
+        output, rows = shared, []
+        for index, result in results:
+            if isinstance(result, Failure):
+                continue
+            if result is None:
+                result = shared[index]
+            if output is None:
+                output = np.empty((size, ) + np.shape(result), dtype=np.asarray(result).dtype)
+            if isinstance(output, np.ndarray) and np.shape(result) != output.shape[1:]:
+                logging.debug('Output shape %s differs from %s, results are not preallocated', np.shape(result), output.shape[1:])
+                output = dict(zip(rows, output[rows]))
+            if output is not shared:
+                output[index] = result
+            rows.append(index)
+        if output is None:
+            return []
+        # Drop the rows of skipped tasks
+        if isinstance(output, dict):
+            return [output[row] for row in sorted(rows)]
+        if self.failures:
+            output = np.delete(output, [failure.index for failure in self.failures], axis=0)
+        return output
+
+    def encode_labels(self, labels: List[str]) -> Tuple[np.ndarray, List[str]]:
         if self.labels_mapping is not None:
             labels = [self.labels_mapping[label] for label in labels]
         onehot_encoder = sorted(set(labels))
@@ -67,10 +575,33 @@ class Pipeline():
             onehot_encoder.remove(class_id)
             onehot_encoder = [class_id] + onehot_encoder
         labels = np.array([onehot_encoder.index(label) for label in labels])
-        if any([p.__class__.__name__ == 'ToNumpy' for p in self.pipeline]):
-            data = np.array(data)
+        return labels, onehot_encoder
+
+    def encode_data(self, data: List):
+        if self.is_numpy():
+            data = np.asarray(data)
+        return data
+
+    def encode(self, data: List, labels: List[str]) -> Dict:
+        labels, onehot_encoder = self.encode_labels(labels)
+        data = self.encode_data(data)
         return {'data': data, 'labels': labels, 'labels_encoder': onehot_encoder}
 
+    def run(self, data) -> Dict:
+        labels = [raw.label for raw in data]
+        data = self.transform(data)
+        failed = {failure.index for failure in self.failures}
+        labels = [label for i, label in enumerate(labels) if i not in failed]
+        data = self.encode(data, labels)
+        data['failures'] = self.get_failures_report()
+        if self.profiler is not None:
+            logging.info('Pipeline profile:\n%s', self.profiler.summary())
+        return data
+
+    def get_failures_report(self) -> List[Dict]:
+        # Failures of the last run, sorted by annotation index
+        return [failure._asdict() for failure in sorted(self.failures)]
+
     def to_json(self) -> str:
         json = [p.to_json() for p in self.pipeline]
         json = '[ ' + ', '.join(json) + ' ]'
@@ -9,6 +9,14 @@ from typing import List
 
 class Preprocessor(ABC):
 
+    # Raw to Raw stages that can run once on a whole recording
+    # before annotations windows are sliced out of it
+    file_level: bool = False
+
+    # Environment entries read by the stage, its outputs are cached by these
+    # only, None if unknown, e.g. custom stages, so any entry is relevant
+    environment_keys: List[str] = None
+
     def __init__(self) -> None:
         logging.debug('Create new preprocessor')
 
@@ -38,6 +46,16 @@ class ForkedPreprocessor(Preprocessor):
         self.inputs = inputs
         self.output = output
 
+    @property
+    def environment_keys(self) -> List[str]:
+        preprocessors = [self.output]
+        for item in self.inputs:
+            preprocessors += item if isinstance(item, list) else [item]
+        keys = [p.environment_keys for p in preprocessors]
+        if any(k is None for k in keys):
+            return None
+        return sorted(set().union(*keys))
+
     def run(self, data, **kwargs):
         results = []
         for item in self.inputs:
@@ -0,0 +1,237 @@
+import os
+import sys
+import json
+import time
+import logging
+import tempfile
+import threading
+
+from typing import Callable, Dict, List
+
+import numpy as np
+import pandas as pd
+
+from .eeg_array import EEGArray
+
+try:
+    import resource
+except ImportError:
+    # Peak resident set size is not available on Windows
+    resource = None
+
+# Resident set size units of 'ru_maxrss', bytes on macOS, kilobytes elsewhere
+RSS_SCALE = 1 if sys.platform == 'darwin' else 1024
+
+# Overall throughput metrics, computed on the decoded recordings
+THROUGHPUT = [
+    ('files_per_second', 'Preprocessed recordings per second'),
+    ('samples_per_second', 'Decoded signal samples per second'),
+    ('megabytes_per_second', 'Decoded signal megabytes per second'),
+]
+
+
+def get_size(data) -> int:
+    # Approximate in-memory size of a stage output in bytes
+    if isinstance(data, (list, tuple)):
+        return sum(get_size(d) for d in data)
+    if isinstance(data, np.ndarray):
+        return data.nbytes
+    if isinstance(data, EEGArray):
+        return data.data.nbytes
+    if isinstance(data, pd.DataFrame):
+        return int(data.memory_usage(index=False).sum())
+    if isinstance(data, pd.Series):
+        return int(data.memory_usage(index=False))
+    if hasattr(data, 'n_times') and hasattr(data, 'ch_names'):
+        # Loaded mne.io.Raw signals are stored as float64
+        return int(8 * len(data.ch_names) * data.n_times)
+    return sys.getsizeof(data)
+
+
+def get_peak_rss() -> int:
+    if resource is None:
+        return 0
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * RSS_SCALE
+
+
+class Profiler():
+
+    def __init__(self, memory: bool = False) -> None:
+        logging.debug('Create new pipeline profiler')
+        # Peak resident set size delta of each stage, i.e. how much it raised the peak
+        self.memory = memory
+        # Measures taken by the worker for the current task, shipped back with its result,
+        # kept per thread since thread workers run tasks concurrently
+        self._local = threading.local()
+        # Measures aggregated by the parent process
+        self.records = []
+        self.elapsed = 0.0
+
+    def __getstate__(self):
+        # Workers only need the configuration, not the aggregated measures
+        state = self.__dict__.copy()
+        del state['_local']
+        state['records'] = []
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._local = threading.local()
+
+    @property
+    def pending(self) -> List[Dict]:
+        if not hasattr(self._local, 'pending'):
+            self._local.pending = []
+        return self._local.pending
+
+    def measure(self, stage: int, name: str, task, function: Callable, *args, **kwargs):
+        rss = get_peak_rss() if self.memory else 0
+        wall, cpu = time.perf_counter(), time.process_time()
+        data = function(*args, **kwargs)
+        record = {
+            'file_uuid': task.file_uuid,
+            'stage': stage,
+            'preprocessor': name,
+            'wall': time.perf_counter() - wall,
+            'cpu': time.process_time() - cpu,
+            'size': get_size(data),
+        }
+        if self.memory:
+            record['rss'] = get_peak_rss() - rss
+        # Decoded signal samples, i.e. channels times time samples
+        if stage < 0:
+            record['samples'] = int(len(data.ch_names) * data.n_times)
+        self.pending.append(record)
+        return data
+
+    def pop(self) -> List[Dict]:
+        records, self._local.pending = self.pending, []
+        return records
+
+    def add(self, records: List[Dict]) -> None:
+        self.records.extend(records)
+
+    def add_elapsed(self, elapsed: float) -> None:
+        self.elapsed += elapsed
+
+    def reset(self) -> None:
+        self._local.pending = []
+        self.records = []
+        self.elapsed = 0.0
+
+    def get_stages(self) -> List[Dict]:
+        # Aggregate measures by stage, reading the recordings is stage -1
+        stages = {}
+        for record in self.records:
+            stages.setdefault((record['stage'], record['preprocessor']), []).append(record)
+        report = []
+        for (stage, name), records in sorted(stages.items()):
+            wall = np.array([r['wall'] for r in records])
+            cpu = np.array([r['cpu'] for r in records])
+            size = np.array([r['size'] for r in records])
+            stats = {
+                'stage': stage,
+                'preprocessor': name,
+                'calls': len(records),
+                'wall_total': float(wall.sum()),
+                'wall_mean': float(wall.mean()),
+                'wall_p95': float(np.percentile(wall, 95)),
+                'cpu_total': float(cpu.sum()),
+                'size_mean': float(size.mean()),
+            }
+            if self.memory:
+                stats['rss_max'] = int(max(r.get('rss', 0) for r in records))
+            report.append(stats)
+        return report
+
+    def get_throughput(self) -> Dict:
+        reads = [r for r in self.records if r['stage'] < 0]
+        files = len({r['file_uuid'] for r in reads})
+        samples = sum(r['samples'] for r in reads)
+        size = sum(r['size'] for r in reads)
+        elapsed = self.elapsed if self.elapsed > 0 else float('inf')
+        return {
+            'elapsed': self.elapsed,
+            'files': files,
+            'samples': samples,
+            'bytes': size,
+            'files_per_second': files / elapsed,
+            'samples_per_second': samples / elapsed,
+            'megabytes_per_second': size / 1e6 / elapsed,
+        }
+
+    def summary(self) -> str:
+        stages = self.get_stages()
+        total = sum(s['wall_total'] for s in stages) or float('inf')
+        header = '{:>5} {:<24} {:>7} {:>10} {:>6} {:>10} {:>10} {:>7} {:>12}'.format(
+            'stage', 'preprocessor', 'calls', 'wall (s)', '%', 'mean (ms)', 'p95 (ms)', 'cpu %', 'output (KB)'
+        )
+        if self.memory:
+            header += ' {:>13}'.format('peak rss (MB)')
+        lines = [header, '-' * len(header)]
+        for s in stages:
+            line = '{:>5} {:<24} {:>7} {:>10.3f} {:>6.1f} {:>10.3f} {:>10.3f} {:>7.1f} {:>12.1f}'.format(
+                s['stage'] if s['stage'] >= 0 else '-',
+                s['preprocessor'][:24],
+                s['calls'],
+                s['wall_total'],
+                100 * s['wall_total'] / total,
+                1e3 * s['wall_mean'],
+                1e3 * s['wall_p95'],
+                100 * s['cpu_total'] / s['wall_total'] if s['wall_total'] > 0 else 0.0,
+                s['size_mean'] / 1e3,
+            )
+            if self.memory:
+                line += ' {:>13.1f}'.format(s['rss_max'] / 1e6)
+            lines.append(line)
+        throughput = self.get_throughput()
+        lines.append('-' * len(header))
+        lines.append('{} files, {} samples, {:.1f} MB in {:.3f} s: {:.2f} files/s, {:.0f} samples/s, {:.2f} MB/s'.format(
+            throughput['files'],
+            throughput['samples'],
+            throughput['bytes'] / 1e6,
+            throughput['elapsed'],
+            throughput['files_per_second'],
+            throughput['samples_per_second'],
+            throughput['megabytes_per_second'],
+        ))
+        return '\n'.join(lines)
+
+    def to_json(self) -> str:
+        report = {'stages': self.get_stages(), 'throughput': self.get_throughput()}
+        return json.dumps(report, indent=2)
+
+    def to_prometheus(self) -> str:
+        # Prometheus text exposition format, e.g. for the node exporter textfile collector
+        metrics = [
+            ('stage_calls_total', 'counter', 'Preprocessed annotations per pipeline stage', 'calls'),
+            ('stage_wall_seconds_total', 'counter', 'Wall time spent per pipeline stage', 'wall_total'),
+            ('stage_cpu_seconds_total', 'counter', 'CPU time spent per pipeline stage', 'cpu_total'),
+            ('stage_output_bytes', 'gauge', 'Mean output size per pipeline stage', 'size_mean'),
+        ]
+        if self.memory:
+            metrics.append(('stage_peak_rss_bytes', 'gauge', 'Maximum peak RSS increase per pipeline stage', 'rss_max'))
+        stages = self.get_stages()
+        lines = []
+        for name, kind, description, key in metrics:
+            lines.append('# HELP pyeeglab_{} {}'.format(name, description))
+            lines.append('# TYPE pyeeglab_{} {}'.format(name, kind))
+            for s in stages:
+                lines.append('pyeeglab_{}{{stage="{}",preprocessor="{}"}} {}'.format(
+                    name, s['stage'], s['preprocessor'], s[key]
+                ))
+        throughput = self.get_throughput()
+        for name, description in THROUGHPUT:
+            lines.append('# HELP pyeeglab_{} {}'.format(name, description))
+            lines.append('# TYPE pyeeglab_{} gauge'.format(name))
+            lines.append('pyeeglab_{} {}'.format(name, throughput[name]))
+        return '\n'.join(lines) + '\n'
+
+    def save(self, path: str) -> None:
+        # Save the JSON report, or the Prometheus one if the path ends with .prom,
+        # writes are atomic so collectors never read partial files
+        text = self.to_prometheus() if path.endswith('.prom') else self.to_json()
+        descriptor, temp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)))
+        with os.fdopen(descriptor, 'w') as writer:
+            writer.write(text)
+        os.replace(temp, path)
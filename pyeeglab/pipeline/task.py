@@ -0,0 +1,75 @@
+from typing import List, NamedTuple
+
+from mne.io import Raw
+
+from ..dataset.edf import get_window_samples, read_window
+
+
+class Task(NamedTuple):
+    # Plain, cheaply pickled description of an annotation to preprocess
+    file_uuid: str
+    path: str
+    begin: float
+    end: float
+    label: str
+    sfreq: float
+    fingerprint: List
+    # Recording duration, windows are clamped before its end, None if unknown
+    file_duration: float = None
+
+    @classmethod
+    def from_annotation(cls, annotation, sfreq: float = None, file_duration: float = None) -> "Task":
+        # Recording metadata is read from the index if not given
+        if sfreq is None or file_duration is None:
+            for metadata in annotation.file.meta[:1]:
+                sfreq = metadata.sampling_frequency if sfreq is None else sfreq
+                file_duration = metadata.duration if file_duration is None else file_duration
+        return cls(
+            annotation.file_uuid,
+            annotation.file.path,
+            annotation.begin,
+            annotation.end,
+            annotation.label,
+            sfreq,
+            annotation.fingerprint,
+            file_duration
+        )
+
+    @property
+    def duration(self) -> float:
+        return self.end - self.begin
+
+    def get_samples(self) -> int:
+        # Number of samples read by read_window
+        return get_window_samples(self.begin, self.end, self.sfreq, self.file_duration)
+
+    def read(self, channels: List[str] = None) -> Raw:
+        return read_window(self.path, self.begin, self.end, channels)
+
+
+class Failure(NamedTuple):
+    # Report of an annotation that could not be preprocessed,
+    # index is the position of the annotation in the run input
+    index: int
+    file_uuid: str
+    path: str
+    begin: float
+    end: float
+    label: str
+    error: str
+    traceback: str
+    attempts: int
+
+    @classmethod
+    def from_task(cls, task: Task, error: BaseException, traceback: str = "") -> "Failure":
+        return cls(
+            None,
+            task.file_uuid,
+            task.path,
+            task.begin,
+            task.end,
+            task.label,
+            repr(error),
+            traceback,
+            1
+        )
@@ -1,3 +1,8 @@
-from .features import *
-from .signal import *
-from .transform import *
+from ..lazy import lazy_module
+from . import features, signal, transform
+
+__getattr__, __dir__, __all__ = lazy_module(__name__, {
+    **{attribute: ".features" for attribute in features.__all__},
+    **{attribute: ".signal" for attribute in signal.__all__},
+    **{attribute: ".transform" for attribute in transform.__all__},
+})
@@ -1,2 +1,14 @@
-from .brain_connectivity import SpearmanCorrelation, BinarizedSpearmanCorrelation, Bandpower
-from .stat_features import Mean, Variance, Skewness, Kurtosis, ZeroCrossing, AbsoluteArea, PeakToPeak
+from ...lazy import lazy_module
+
+__getattr__, __dir__, __all__ = lazy_module(__name__, {
+    "SpearmanCorrelation": ".brain_connectivity",
+    "BinarizedSpearmanCorrelation": ".brain_connectivity",
+    "Bandpower": ".brain_connectivity",
+    "Mean": ".stat_features",
+    "Variance": ".stat_features",
+    "Skewness": ".stat_features",
+    "Kurtosis": ".stat_features",
+    "ZeroCrossing": ".stat_features",
+    "AbsoluteArea": ".stat_features",
+    "PeakToPeak": ".stat_features",
+})
@@ -2,22 +2,27 @@ import json
 import logging
 
 from itertools import product
-from typing import List
+from typing import List, Union
 
 import numpy as np
 import pandas as pd
 from yasa import bandpower
 
 from ...pipeline import Preprocessor
+from ...pipeline.eeg_array import EEGArray
 
 
 class SpearmanCorrelation(Preprocessor):
 
+    environment_keys = []
+
     def __init__(self) -> None:
         super().__init__()
         logging.debug('Create spearman correlation preprocessor')
 
-    def run(self, data: List[pd.DataFrame], **kwargs) -> List[pd.DataFrame]:
+    def run(self, data: Union[List[pd.DataFrame], EEGArray], **kwargs) -> List[pd.DataFrame]:
+        if isinstance(data, EEGArray):
+            data = data.to_dataframe()
         return [d.corr(method='spearman').rename_axis(None) for d in data]
 
 
@@ -68,6 +73,8 @@ class BinarizedSpearmanCorrelation(SpearmanCorrelation):
 
 class Bandpower(Preprocessor):
 
+    environment_keys = ['lowest_frequency']
+
     def __init__(self, bands: List[str] = ['Delta', 'Theta', 'Alpha', 'Beta', 'Gamma']) -> None:
         super().__init__()
         logging.debug('Create bandpower (%s) preprocessor', ','.join(bands))
@@ -82,7 +89,14 @@ class Bandpower(Preprocessor):
         out = json.dumps(out)
         return out
 
-    def run(self, data: List[pd.DataFrame], **kwargs) -> List[pd.DataFrame]:
+    def run(self, data: Union[List[pd.DataFrame], EEGArray], **kwargs) -> Union[List[pd.DataFrame], EEGArray]:
+        if isinstance(data, EEGArray):
+            # Windows are already channels by samples
+            powers = [
+                bandpower(d, kwargs['lowest_frequency'], data.ch_names).loc[:, self.bands].to_numpy()
+                for d in data.data
+            ]
+            return data.to_features(list(self.bands), np.array(powers))
         data = [d.swapaxes('index', 'columns') for d in data]
         data = [
             bandpower(d.to_numpy(), kwargs['lowest_frequency'], d.index)
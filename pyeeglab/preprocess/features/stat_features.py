@@ -1,34 +1,89 @@
-from typing import List
+from typing import List, Union
 
 import numpy as np
 import pandas as pd
 from scipy.integrate import simps
 
 from ...pipeline import Preprocessor
+from ...pipeline.eeg_array import EEGArray
+
+
+def _zero_out_fperr(array: np.ndarray) -> np.ndarray:
+    # Treat floating point errors as zeros, as pandas does
+    return np.where(np.abs(array) < 1e-14, 0, array)
+
+
+def skewness(data: np.ndarray) -> np.ndarray:
+    # Unbiased skewness along the last axis, same as pandas.DataFrame.skew
+    count = data.shape[-1]
+    adjusted = data - data.mean(axis=-1, keepdims=True)
+    adjusted2 = adjusted ** 2
+    m2 = _zero_out_fperr(adjusted2.sum(axis=-1))
+    m3 = _zero_out_fperr((adjusted2 * adjusted).sum(axis=-1))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        result = (count * (count - 1) ** 0.5 / (count - 2)) * (m3 / m2 ** 1.5)
+    result = np.where(m2 == 0, 0, result)
+    return result if count >= 3 else np.full_like(result, np.nan)
+
+
+def kurtosis(data: np.ndarray) -> np.ndarray:
+    # Unbiased excess kurtosis along the last axis, same as pandas.DataFrame.kurt
+    count = data.shape[-1]
+    adjusted2 = (data - data.mean(axis=-1, keepdims=True)) ** 2
+    m2 = adjusted2.sum(axis=-1)
+    m4 = (adjusted2 ** 2).sum(axis=-1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        adj = 3 * (count - 1) ** 2 / ((count - 2) * (count - 3))
+        numerator = _zero_out_fperr(count * (count + 1) * (count - 1) * m4)
+        denominator = _zero_out_fperr((count - 2) * (count - 3) * m2 ** 2)
+        result = numerator / denominator - adj
+    result = np.where(denominator == 0, 0, result)
+    return result if count >= 4 else np.full_like(result, np.nan)
 
 
 class Mean(Preprocessor):
-    def run(self, data: List[pd.DataFrame], **kwargs) -> List[pd.DataFrame]:
+    environment_keys = []
+
+    def run(self, data: Union[List[pd.DataFrame], EEGArray], **kwargs) -> Union[List[pd.DataFrame], EEGArray]:
+        if isinstance(data, EEGArray):
+            return data.to_features('Mean', data.data.mean(axis=-1))
         return [d.mean().to_frame(name='Mean') for d in data]
 
 
 class Variance(Preprocessor):
-    def run(self, data: List[pd.DataFrame], **kwargs) -> List[pd.DataFrame]:
+    environment_keys = []
+
+    def run(self, data: Union[List[pd.DataFrame], EEGArray], **kwargs) -> Union[List[pd.DataFrame], EEGArray]:
+        if isinstance(data, EEGArray):
+            return data.to_features('Variance', data.data.var(axis=-1, ddof=1))
         return [d.var().to_frame(name='Variance') for d in data]
 
 
 class Skewness(Preprocessor):
-    def run(self, data: List[pd.DataFrame], **kwargs) -> List[pd.DataFrame]:
+    environment_keys = []
+
+    def run(self, data: Union[List[pd.DataFrame], EEGArray], **kwargs) -> Union[List[pd.DataFrame], EEGArray]:
+        if isinstance(data, EEGArray):
+            return data.to_features('Skewness', skewness(data.data))
         return [d.skew().to_frame(name='Skewness') for d in data]
 
 
 class Kurtosis(Preprocessor):
-    def run(self, data: List[pd.DataFrame], **kwargs) -> List[pd.DataFrame]:
+    environment_keys = []
+
+    def run(self, data: Union[List[pd.DataFrame], EEGArray], **kwargs) -> Union[List[pd.DataFrame], EEGArray]:
+        if isinstance(data, EEGArray):
+            return data.to_features('Kurtosis', kurtosis(data.data))
         return [d.kurt().to_frame(name='Kurtosis') for d in data]
 
 
 class ZeroCrossing(Preprocessor):
-    def run(self, data: List[pd.DataFrame], **kwargs) -> List[pd.DataFrame]:
+    environment_keys = []
+
+    def run(self, data: Union[List[pd.DataFrame], EEGArray], **kwargs) -> Union[List[pd.DataFrame], EEGArray]:
+        if isinstance(data, EEGArray):
+            crossings = np.count_nonzero(np.diff(np.sign(data.data), axis=-1), axis=-1)
+            return data.to_features('Zero Crossing', crossings)
 
         def zero_crossing(array: np.ndarray) -> np.ndarray:
             return np.where(np.diff(np.sign(array)))[0].shape[0]
@@ -40,7 +95,11 @@ class ZeroCrossing(Preprocessor):
 
 
 class AbsoluteArea(Preprocessor):
-    def run(self, data: List[pd.DataFrame], **kwargs) -> List[pd.DataFrame]:
+    environment_keys = []
+
+    def run(self, data: Union[List[pd.DataFrame], EEGArray], **kwargs) -> Union[List[pd.DataFrame], EEGArray]:
+        if isinstance(data, EEGArray):
+            return data.to_features('Absolute Area', simps(np.abs(data.data), dx=1e-6, axis=-1))
 
         def absolute_area(array: np.ndarray) -> np.ndarray:
             return simps(np.abs(array), dx=1e-6)
@@ -52,7 +111,11 @@ class AbsoluteArea(Preprocessor):
 
 
 class PeakToPeak(Preprocessor):
-    def run(self, data: List[pd.DataFrame], **kwargs) -> List[pd.DataFrame]:
+    environment_keys = []
+
+    def run(self, data: Union[List[pd.DataFrame], EEGArray], **kwargs) -> Union[List[pd.DataFrame], EEGArray]:
+        if isinstance(data, EEGArray):
+            return data.to_features('Peak To Peak', np.ptp(data.data, axis=-1))
 
         def pk2pk(array: np.ndarray) -> np.ndarray:
             return np.max(array) - np.min(array)
@@ -1,4 +1,10 @@
-from .channel_selector import CommonChannelSet
-from .frequency_selector import LowestFrequency
-from .filter_selector import BandPassFrequency, NotchFrequency
-from .normalization import MinMaxNormalization, MinMaxCentralizedNormalization
+from ...lazy import lazy_module
+
+__getattr__, __dir__, __all__ = lazy_module(__name__, {
+    "CommonChannelSet": ".channel_selector",
+    "LowestFrequency": ".frequency_selector",
+    "BandPassFrequency": ".filter_selector",
+    "NotchFrequency": ".filter_selector",
+    "MinMaxNormalization": ".normalization",
+    "MinMaxCentralizedNormalization": ".normalization",
+})
@@ -9,6 +9,9 @@ from ...pipeline import Preprocessor
 
 class CommonChannelSet(Preprocessor):
 
+    file_level = True
+    environment_keys = ['channels_set']
+
     def __init__(self, blacklist: List[str] = None) -> None:
         super().__init__()
         logging.debug('Create common channels_set preprocessor')
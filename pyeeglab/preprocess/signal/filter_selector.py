@@ -8,6 +8,9 @@ from ...pipeline import Preprocessor
 
 class BandPassFrequency(Preprocessor):
 
+    file_level = True
+    environment_keys = []
+
     def __init__(self, low_freq: float, high_freq: float) -> None:
         super().__init__()
         self.low_freq = low_freq
@@ -30,6 +33,9 @@ class BandPassFrequency(Preprocessor):
 
 class NotchFrequency(Preprocessor):
 
+    file_level = True
+    environment_keys = []
+
     def __init__(self, freq: float) -> None:
         super().__init__()
         self.freq = freq
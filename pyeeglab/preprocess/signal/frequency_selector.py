@@ -7,6 +7,9 @@ from ...pipeline import Preprocessor
 
 class LowestFrequency(Preprocessor):
 
+    file_level = True
+    environment_keys = ['lowest_frequency']
+
     def __init__(self) -> None:
         super().__init__()
         logging.debug('Create lowest_frequency preprocessor')
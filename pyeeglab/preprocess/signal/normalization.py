@@ -1,28 +1,38 @@
 import logging
 
-from typing import List
+from dataclasses import replace
+from typing import List, Union
 
 import numpy as np
 import pandas as pd
 
 from ...pipeline import Preprocessor
+from ...pipeline.eeg_array import EEGArray
 
 
 class MinMaxNormalization(Preprocessor):
-    def run(self, data: pd.DataFrame, **kwargs) -> pd.DataFrame:
+    environment_keys = ['min_value', 'max_value']
+
+    def run(self, data: Union[pd.DataFrame, EEGArray], **kwargs) -> Union[pd.DataFrame, EEGArray]:
 
         def min_max_norm(array: np.ndarray, _min: float, _max: float) -> np.ndarray:
             return (array - _min)/(_max - _min)
 
         args = (kwargs['min_value'], kwargs['max_value'])
+        if isinstance(data, EEGArray):
+            return replace(data, data=min_max_norm(data.data, *args))
         return data.apply(min_max_norm, args=args, raw=True)
 
 
 class MinMaxCentralizedNormalization(Preprocessor):
-    def run(self, data: pd.DataFrame, **kwargs) -> pd.DataFrame:
+    environment_keys = ['min_value', 'max_value']
+
+    def run(self, data: Union[pd.DataFrame, EEGArray], **kwargs) -> Union[pd.DataFrame, EEGArray]:
 
         def min_max_norm(array: np.ndarray, _min: float, _max: float) -> np.ndarray:
             return (array - ((_max + _min)/2))/((_max - _min)/2)
 
         args = (kwargs['min_value'], kwargs['max_value'])
+        if isinstance(data, EEGArray):
+            return replace(data, data=min_max_norm(data.data, *args))
         return data.apply(min_max_norm, args=args, raw=True)
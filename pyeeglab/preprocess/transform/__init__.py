@@ -1,2 +1,13 @@
-from .data_converter import ToDataframe, ToNumpy, ToMergedDataframes, CorrelationToAdjacency
-from .frame_generator import StaticWindow, DynamicWindow, StaticWindowOverlap, DynamicWindowOverlap
+from ...lazy import lazy_module
+
+__getattr__, __dir__, __all__ = lazy_module(__name__, {
+    "ToDataframe": ".data_converter",
+    "ToEEGArray": ".data_converter",
+    "ToNumpy": ".data_converter",
+    "ToMergedDataframes": ".data_converter",
+    "CorrelationToAdjacency": ".data_converter",
+    "StaticWindow": ".frame_generator",
+    "DynamicWindow": ".frame_generator",
+    "StaticWindowOverlap": ".frame_generator",
+    "DynamicWindowOverlap": ".frame_generator",
+})
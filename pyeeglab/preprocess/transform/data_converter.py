@@ -1,7 +1,7 @@
 import json
 import logging
 
-from typing import List
+from typing import List, Union
 
 import numpy as np
 import pandas as pd
@@ -9,21 +9,40 @@ import pandas as pd
 from mne.io import Raw
 
 from ...pipeline import Preprocessor
+from ...pipeline.eeg_array import EEGArray
 
 
 class ToDataframe(Preprocessor):
 
+    environment_keys = []
+
     def __init__(self) -> None:
         super().__init__()
         logging.debug('Create DataFrame converter preprocessor')
 
-    def run(self, data: Raw, **kwargs) -> pd.DataFrame:
+    def run(self, data: Union[Raw, EEGArray], **kwargs) -> pd.DataFrame:
+        if isinstance(data, EEGArray):
+            return data.to_dataframe()
         dataframe = data.to_data_frame().drop('time', axis=1)
         return dataframe
 
 
+class ToEEGArray(Preprocessor):
+
+    environment_keys = []
+
+    def __init__(self) -> None:
+        super().__init__()
+        logging.debug('Create EEGArray converter preprocessor')
+
+    def run(self, data: Raw, **kwargs) -> EEGArray:
+        return EEGArray.from_raw(data)
+
+
 class ToNumpy(Preprocessor):
 
+    environment_keys = []
+
     def __init__(self, dtype: str = 'float32') -> None:
         super().__init__()
         logging.debug('Create Numpy (%s) converter preprocessor', dtype)
@@ -38,23 +57,37 @@ class ToNumpy(Preprocessor):
         out = json.dumps(out)
         return out
 
-    def run(self, data: List[pd.DataFrame], **kwargs) -> List[np.ndarray]:
-        data = np.array([d.to_numpy(dtype=self.dtype) for d in data])
-        return data
+    def run(self, data: Union[List[pd.DataFrame], EEGArray], **kwargs) -> List[np.ndarray]:
+        if isinstance(data, EEGArray):
+            return data.to_numpy(self.dtype)
+        if len({d.shape for d in data}) > 1:
+            return np.array([d.to_numpy(dtype=self.dtype) for d in data])
+        # Allocate once and cast each frame in place
+        output = np.empty((len(data), ) + data[0].shape, dtype=self.dtype)
+        for i, d in enumerate(data):
+            output[i] = d.to_numpy()
+        return output
 
 
 class ToMergedDataframes(Preprocessor):
+    environment_keys = []
+
     def run(self, data: List[List[pd.DataFrame]], **kwargs) -> List[pd.DataFrame]:
+        data = [d.to_dataframe() if isinstance(d, EEGArray) else d for d in data]
         return [pd.concat([d[i].T for d in data]).T for i, _ in enumerate(data[0])]
 
 
 class CorrelationToAdjacency(Preprocessor):
 
+    environment_keys = []
+
     def __init__(self) -> None:
         super().__init__()
         logging.debug('Create adjacency converter preprocessor')
 
     def run(self, data: List[pd.DataFrame], **kwargs) -> List[pd.DataFrame]:
+        if isinstance(data, EEGArray):
+            data = data.to_dataframe()
         mask = np.triu(np.ones(data[0].shape, dtype='bool'), k=1)
         data = [d.where(mask) for d in data]
         data = [d.stack().reset_index() for d in data]
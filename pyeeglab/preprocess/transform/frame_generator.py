@@ -2,15 +2,29 @@ import json
 import logging
 
 from math import floor
-from typing import List
+from typing import List, Union
 
 import pandas as pd
 
 from ...pipeline import Preprocessor
+from ...pipeline.eeg_array import EEGArray
+
+
+def _get_length(data: Union[pd.DataFrame, EEGArray]) -> int:
+    return data.n_times if isinstance(data, EEGArray) else len(data)
+
+
+def _get_frames(data: Union[pd.DataFrame, EEGArray], starts: range, step: int) -> Union[List[pd.DataFrame], EEGArray]:
+    # Frames of EEGArray signals are strided views along a windows axis
+    if isinstance(data, EEGArray):
+        return data.get_windows(starts, step)
+    return [data[t:t+step] for t in starts]
 
 
 class StaticWindow(Preprocessor):
 
+    environment_keys = ['lowest_frequency']
+
     def __init__(self, frames: int, length: float) -> None:
         super().__init__()
         self.frames = frames
@@ -27,15 +41,17 @@ class StaticWindow(Preprocessor):
         out = json.dumps(out)
         return out
 
-    def run(self, data: pd.DataFrame, **kwargs) -> List[pd.DataFrame]:
+    def run(self, data: Union[pd.DataFrame, EEGArray], **kwargs) -> Union[List[pd.DataFrame], EEGArray]:
         step = floor(self.length * kwargs['lowest_frequency'])
-        if (step * self.frames > len(data)):
+        if (step * self.frames > _get_length(data)):
             raise RuntimeError('Error while creating static frames: not enough data.')
-        return [data[t:t+step] for t in range(0, step * self.frames, step)]
+        return _get_frames(data, range(0, step * self.frames, step), step)
 
 
 class StaticWindowOverlap(Preprocessor):
 
+    environment_keys = ['lowest_frequency']
+
     def __init__(self, frames: int, length: float, overlap: float) -> None:
         super().__init__()
         self.frames = frames
@@ -54,15 +70,18 @@ class StaticWindowOverlap(Preprocessor):
         out = json.dumps(out)
         return out
 
-    def run(self, data: pd.DataFrame, **kwargs) -> List[pd.DataFrame]:
+    def run(self, data: Union[pd.DataFrame, EEGArray], **kwargs) -> Union[List[pd.DataFrame], EEGArray]:
         step = floor(self.length * kwargs['lowest_frequency'])
-        if (step * self.frames * (1 - self.overlap) > len(data)):
+        if (step * self.frames * (1 - self.overlap) > _get_length(data)):
             raise RuntimeError('Error while creating static frames: not enough data.')
-        return [data[t:t+step] for t in range(0, floor(step * self.frames * (1 - self.overlap)), floor(step * (1 - self.overlap)))]
+        starts = range(0, floor(step * self.frames * (1 - self.overlap)), floor(step * (1 - self.overlap)))
+        return _get_frames(data, starts, step)
 
 
 class DynamicWindow(Preprocessor):
 
+    environment_keys = []
+
     def __init__(self, frames: int) -> None:
         super().__init__()
         self.frames = frames
@@ -77,15 +96,18 @@ class DynamicWindow(Preprocessor):
         out = json.dumps(out)
         return out
 
-    def run(self, data: pd.DataFrame, **kwargs) -> List[pd.DataFrame]:
-        step = len(data)
+    def run(self, data: Union[pd.DataFrame, EEGArray], **kwargs) -> Union[List[pd.DataFrame], EEGArray]:
+        length = _get_length(data)
+        step = length
         if self.frames > 1:
             step = floor(step/self.frames)
-        return [data[t:t+step] for t in range(0, len(data) - step + 1, step)]
+        return _get_frames(data, range(0, length - step + 1, step), step)
 
 
 class DynamicWindowOverlap(Preprocessor):
 
+    environment_keys = []
+
     def __init__(self, frames: int, overlap: float) -> None:
         super().__init__()
         self.frames = frames
@@ -102,8 +124,9 @@ class DynamicWindowOverlap(Preprocessor):
         out = json.dumps(out)
         return out
 
-    def run(self, data: pd.DataFrame, **kwargs) -> List[pd.DataFrame]:
-        step = len(data)
+    def run(self, data: Union[pd.DataFrame, EEGArray], **kwargs) -> Union[List[pd.DataFrame], EEGArray]:
+        length = _get_length(data)
+        step = length
         if self.frames > 1:
             step = floor(step/self.frames)
-        return [data[t:t+step] for t in range(0, len(data) - step + 1, floor(step * (1 - self.overlap)))]
+        return _get_frames(data, range(0, length - step + 1, floor(step * (1 - self.overlap))), step)
@@ -0,0 +1,73 @@
+import os
+import sys
+import tempfile
+import unittest
+import numpy as np
+from multiprocessing import Pool
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from pyeeglab import *
+
+def hammer(args):
+    path, seed = args
+    cache = Cache(path, max_size=20000)
+    for i in range(100):
+        key = str((seed + i) % 10)
+        cache.set(key, np.full(500, seed))
+        value = cache.get(key)
+        assert value is None or value.shape == (500, )
+    return seed
+
+class TestCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = self.directory.name
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_get_set(self):
+        cache = Cache(self.path)
+        cache.set('key', [1, 2, 3], 'pipeline')
+        self.assertEqual(cache.get('key'), [1, 2, 3])
+        self.assertIsNone(cache.get('missing'))
+        self.assertEqual(cache.entries()[0]['metadata'], 'pipeline')
+
+    def test_numpy_format(self):
+        cache = Cache(self.path, 'numpy')
+        cache.set('arrays', {'data': np.ones((4, 2)), 'labels_encoder': ['a', 'b']})
+        cache.set('ragged', {'data': [np.ones(2), np.ones(3)]})
+        value = cache.get('arrays')
+        self.assertIsInstance(value['data'], np.memmap)
+        self.assertEqual(value['labels_encoder'], ['a', 'b'])
+        self.assertEqual(len(cache.get('ragged')['data']), 2)
+
+    def test_lru_eviction(self):
+        cache = Cache(self.path)
+        for key in ['a', 'b', 'c']:
+            cache.set(key, np.zeros(1000))
+        cache.get('a')
+        cache = Cache(self.path, max_size=cache.size - 1)
+        cache.set('d', np.zeros(1))
+        self.assertEqual(cache.keys(), ['a', 'c', 'd'])
+        cache.purge()
+        self.assertEqual(cache.keys(), [])
+        self.assertEqual(cache.size, 0)
+
+    def test_concurrent_eviction(self):
+        with Pool(4) as pool:
+            self.assertEqual(pool.map(hammer, [(self.path, seed) for seed in range(4)]), list(range(4)))
+        cache = Cache(self.path)
+        self.assertLessEqual(cache.size, 20000)
+        self.assertEqual(cache.size, sum(entry['size'] for entry in cache.entries()))
+
+    def test_numpy_overwrite(self):
+        cache = Cache(self.path, 'numpy')
+        cache.set('key', {'data': np.zeros(4)})
+        value = cache.get('key')
+        cache.set('key', {'data': np.ones(4)})
+        # Maps of the replaced entry stay valid
+        self.assertTrue(np.array_equal(value['data'], np.zeros(4)))
+        self.assertTrue(np.array_equal(cache.get('key')['data'], np.ones(4)))
+        self.assertEqual(len(os.listdir(os.path.join(self.path, 'key'))), 2)
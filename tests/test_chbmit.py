@@ -1,16 +1,113 @@
 import os
 import sys
+import shutil
+import tempfile
 import unittest
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from pyeeglab import *
 
+def get_rows(dataset):
+    # Indexed files fingerprints and annotations, the latter get new uuids if reindexed
+    files = {file.path: (file.uuid, file.mtime, file.checksum) for file in dataset.session.query(File)}
+    annotations = {}
+    for annotation in dataset.session.query(Annotation):
+        annotations.setdefault(annotation.file_uuid, set()).add(annotation.uuid)
+    return files, annotations
+
 class TestCHBMIT(unittest.TestCase):
     PATH = './tests/samples/physionet.org/files/chbmit/'
 
     def test_index(self):
         PhysioNetCHBMITDataset(self.PATH)
 
+    def test_reindex(self):
+        dataset = PhysioNetCHBMITDataset(self.PATH)
+        files = dataset.session.query(File).count()
+        dataset.index()
+        self.assertEqual(files, dataset.session.query(File).count())
+
+    def get_workspace(self, directory, **kwargs):
+        # Fresh copy of the samples, so files can be changed
+        path = os.path.join(directory, 'chbmit')
+        shutil.copytree(self.PATH, path, ignore=shutil.ignore_patterns('.pyeeglab'))
+        dataset = PhysioNetCHBMITDataset(path, **kwargs)
+        # A recording with seizures annotated in its sidecar and one without
+        paths = sorted(file.path for file in dataset.session.query(File) if file.extension == '.edf')
+        seizures = next(path for path in paths if os.path.isfile(path + '.seizures'))
+        other = next(path for path in paths if path != seizures)
+        return dataset, seizures, other
+
+    def assertReindexed(self, before, after, changed):
+        # Rows of the other files are left untouched
+        files = {path: row for path, row in before[0].items() if path not in changed}
+        self.assertEqual(files, {path: row for path, row in after[0].items() if path not in changed})
+        uuids = {row[0] for path, row in before[0].items() if path in changed}
+        annotations = {uuid: rows for uuid, rows in before[1].items() if uuid not in uuids}
+        self.assertEqual(annotations, {uuid: rows for uuid, rows in after[1].items() if uuid not in uuids})
+
+    def test_reindex_touched(self):
+        with tempfile.TemporaryDirectory() as directory:
+            dataset, path, _ = self.get_workspace(directory, checksum=True)
+            before = get_rows(dataset)
+            mtime = os.stat(path).st_mtime + 10
+            os.utime(path, (mtime, mtime))
+            dataset.index()
+            after = get_rows(dataset)
+            self.assertReindexed(before, after, [path])
+            uuid, _, checksum = before[0][path]
+            # Same content, only the fingerprint is updated
+            self.assertEqual(after[0][path], (uuid, mtime, checksum))
+            self.assertEqual(after[1][uuid], before[1][uuid])
+
+    def test_reindex_modified(self):
+        with tempfile.TemporaryDirectory() as directory:
+            dataset, path, _ = self.get_workspace(directory, checksum=True)
+            before = get_rows(dataset)
+            # Rewrite the EDF patient identification field
+            with open(path, 'r+b') as writer:
+                writer.seek(8)
+                writer.write(b'X'.ljust(80))
+            mtime = os.stat(path).st_mtime + 10
+            os.utime(path, (mtime, mtime))
+            dataset.index()
+            after = get_rows(dataset)
+            self.assertReindexed(before, after, [path])
+            uuid, _, checksum = before[0][path]
+            self.assertEqual(after[0][path][1], mtime)
+            self.assertNotEqual(after[0][path][2], checksum)
+            # Annotations are extracted again
+            self.assertEqual(len(after[1][uuid]), len(before[1][uuid]))
+            self.assertFalse(after[1][uuid] & before[1][uuid])
+
+    def test_reindex_deleted(self):
+        with tempfile.TemporaryDirectory() as directory:
+            dataset, _, path = self.get_workspace(directory)
+            before = get_rows(dataset)
+            os.remove(path)
+            dataset.index()
+            after = get_rows(dataset)
+            self.assertReindexed(before, after, [path])
+            self.assertNotIn(path, after[0])
+            self.assertNotIn(before[0][path][0], after[1])
+            self.assertEqual(dataset.session.query(Metadata).filter(Metadata.file_uuid == before[0][path][0]).count(), 0)
+
+    def test_reindex_sidecar(self):
+        with tempfile.TemporaryDirectory() as directory:
+            dataset, path, _ = self.get_workspace(directory)
+            before = get_rows(dataset)
+            # Recording without seizures sidecar is annotated as seizure free
+            os.remove(path + '.seizures')
+            dataset.index()
+            after = get_rows(dataset)
+            self.assertReindexed(before, after, [path, path + '.seizures'])
+            self.assertNotIn(path + '.seizures', after[0])
+            uuid = before[0][path][0]
+            self.assertEqual(after[0][path], before[0][path])
+            self.assertFalse(after[1][uuid] & before[1][uuid])
+            labels = dataset.session.query(Annotation.label).filter(Annotation.file_uuid == uuid).all()
+            self.assertEqual(labels, [('noseizure', )])
+
     def test_loader(self):
         loader = PhysioNetCHBMITDataset(self.PATH)
         loader.maximal_channels_subset
@@ -0,0 +1,90 @@
+import os
+import sys
+import tempfile
+import unittest
+import numpy as np
+from mne.io import read_raw_edf
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from pyeeglab.dataset.edf import EDFReader, read_window
+
+CHANNELS = ['Fp1', 'Fp2', 'Cz']
+
+def field(value, size):
+    return str(value).ljust(size)[:size].encode('latin-1')
+
+def write_edf(path, samples, records=10):
+    # Minimal EDF file of 1 second data records with random digital values
+    signals = len(samples)
+    header = field(0, 8) + field('X X X X', 80) + field('Startdate X X X X', 80)
+    header += field('01.01.20', 8) + field('00.00.00', 8) + field(256 * (signals + 1), 8)
+    header += field('', 44) + field(records, 8) + field(1, 8) + field(signals, 4)
+    fields = [
+        (CHANNELS[:signals], 16), ([''] * signals, 80), (['uV'] * signals, 8),
+        ([-3200] * signals, 8), ([3200] * signals, 8), ([-32768] * signals, 8),
+        ([32767] * signals, 8), ([''] * signals, 80), (samples, 8), ([''] * signals, 32),
+    ]
+    for values, size in fields:
+        header += b''.join(field(value, size) for value in values)
+    random = np.random.RandomState(42)
+    data = [random.randint(-32768, 32767, (records, n)).astype('<i2') for n in samples]
+    with open(path, 'wb') as writer:
+        writer.write(header)
+        for record in range(records):
+            for signal in data:
+                writer.write(signal[record].tobytes())
+
+def read_mne(path, begin, end, channels=None, preload=True):
+    raw = read_raw_edf(path, preload=preload, verbose=False)
+    # Windows end at most 0.1 seconds before the end of the recording
+    raw.crop(begin, min(end, raw.n_times / raw.info['sfreq'] - 0.1))
+    if channels is not None:
+        raw.pick_channels(channels, ordered=False)
+    # Channels sampled below the recording frequency are resampled on load,
+    # after the crop, as the reader fallback does
+    return raw.load_data()
+
+class TestEDF(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.uniform = os.path.join(self.directory.name, 'uniform.edf')
+        self.mixed = os.path.join(self.directory.name, 'mixed.edf')
+        write_edf(self.uniform, [100, 100, 100])
+        write_edf(self.mixed, [100, 100, 50])
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_header(self):
+        reader = EDFReader(self.uniform)
+        raw = read_raw_edf(self.uniform, verbose=False)
+        self.assertEqual(reader.ch_names, raw.ch_names)
+        self.assertEqual(reader.sfreq, raw.info['sfreq'])
+        self.assertEqual(reader.n_times, raw.n_times)
+        self.assertTrue(np.allclose(reader.get_data(), raw.get_data(), rtol=0, atol=1e-12))
+
+    def test_window(self):
+        for begin, end in [(0, 1), (0.5, 3.25), (2.99, 7), (8, 9.99)]:
+            expected = read_mne(self.uniform, begin, end)
+            window = read_window(self.uniform, begin, end)
+            self.assertEqual(window.ch_names, expected.ch_names)
+            self.assertTrue(np.allclose(window.get_data(), expected.get_data(), rtol=0, atol=1e-12))
+
+    def test_channels(self):
+        expected = read_mne(self.uniform, 1.5, 4, ['Cz', 'Fp1'])
+        window = read_window(self.uniform, 1.5, 4, ['Cz', 'Fp1'])
+        self.assertEqual(window.ch_names, ['Fp1', 'Cz'])
+        self.assertTrue(np.allclose(window.get_data(), expected.get_data(), rtol=0, atol=1e-12))
+
+    def test_non_uniform(self):
+        reader = EDFReader(self.mixed)
+        self.assertTrue(reader.is_uniform(['Fp1', 'Fp2']))
+        self.assertFalse(reader.is_uniform())
+        # Channels sampled at the recording frequency are read from the data records,
+        # the others fallback to MNE cropping and resampling on load
+        for channels, preload in [(['Fp1', 'Fp2'], True), (None, False)]:
+            expected = read_mne(self.mixed, 1, 5, channels, preload)
+            window = read_window(self.mixed, 1, 5, channels)
+            self.assertEqual(window.ch_names, expected.ch_names)
+            self.assertTrue(np.allclose(window.get_data(), expected.get_data(), rtol=0, atol=1e-12))
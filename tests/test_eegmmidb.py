@@ -1,9 +1,45 @@
 import os
 import sys
+import shutil
+import signal
+import tempfile
 import unittest
+from unittest import mock
+from concurrent.futures.process import BrokenProcessPool
+import numpy as np
+from mne.io import read_raw_edf
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from pyeeglab import *
+from pyeeglab.dataset.edf import EDFHeader
+from pyeeglab.dataset.file import File
+from pyeeglab.dataset.metadata import Metadata
+from pyeeglab.dataset.statistics import signal_statistics
+
+class CorruptedRecording(Preprocessor):
+
+    def run(self, data, **kwargs):
+        raise ValueError('Corrupted recording')
+
+class KilledWorker(Preprocessor):
+
+    def run(self, data, **kwargs):
+        # Count preprocessed annotations, kill the worker at the third one
+        if 'KILL_COUNTER' in os.environ:
+            with open(os.environ['KILL_COUNTER'], 'ab') as counter:
+                counter.write(b'x')
+            if os.path.getsize(os.environ['KILL_COUNTER']) == 3:
+                os.kill(os.getpid(), signal.SIGKILL)
+        return data
+
+class CountedStage(Preprocessor):
+    # Reads no environment entries, so its outputs survive data set changes
+    environment_keys = []
+    calls = 0
+
+    def run(self, data, **kwargs):
+        CountedStage.calls += 1
+        return data
 
 class TestEEGMMIDB(unittest.TestCase):
     PATH = './tests/samples/physionet.org/files/eegmmidb/'
@@ -11,6 +47,190 @@ class TestEEGMMIDB(unittest.TestCase):
     def test_index(self):
         PhysioNetEEGMMIDBDataset(self.PATH)
 
+    def test_index_header_only(self):
+        with tempfile.TemporaryDirectory() as directory:
+            # Fresh workspace, so the index is built from the headers
+            path = os.path.join(directory, 'eegmmidb')
+            shutil.copytree(self.PATH, path, ignore=shutil.ignore_patterns('.pyeeglab'))
+            dataset = PhysioNetEEGMMIDBDataset(path, header_only=True)
+            self.assertGreater(dataset.query.count(), 0)
+            self.assertFalse(any(metadata.signal_statistics for _, metadata, _ in dataset.query.all()))
+            for root, _, files in os.walk(path):
+                for name in files:
+                    if not name.endswith('.edf'):
+                        continue
+                    header = EDFHeader.read(os.path.join(root, name))
+                    raw = read_raw_edf(os.path.join(root, name), verbose=False)
+                    self.assertEqual(header.ch_names, raw.ch_names)
+                    self.assertEqual(header.sfreq, raw.info['sfreq'])
+                    self.assertEqual(header.n_times, raw.n_times)
+                    annotations = header.annotations
+                    self.assertEqual([a['description'] for a in annotations], list(raw.annotations.description))
+                    self.assertTrue(np.allclose([a['onset'] for a in annotations], raw.annotations.onset))
+                    self.assertTrue(np.allclose([a['duration'] for a in annotations], raw.annotations.duration))
+
+    def test_add_file_cache(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'eegmmidb')
+            shutil.copytree(self.PATH, path, ignore=shutil.ignore_patterns('.pyeeglab'))
+            dataset = PhysioNetEEGMMIDBDataset(path)
+            # Hold the recording with the widest range out of the first load
+            record = dataset.query.order_by(Metadata.max_value.desc()).first()[0].path
+            held = os.path.join(directory, os.path.basename(record))
+            shutil.move(record, held)
+            dataset.index()
+            environment = dataset.environment
+            preprocessing = Pipeline([
+                CommonChannelSet(),
+                CountedStage(),
+                ToDataframe(),
+                DynamicWindow(4),
+                Skewness(),
+                ToNumpy()
+            ], executor=Executor('serial'))
+            self.assertEqual(preprocessing.get_environment(dataset.environment).keys(), {'channels_set'})
+            dataset.set_pipeline(preprocessing).load()
+            shutil.move(held, record)
+            dataset.index()
+            self.assertNotEqual(dataset.environment['max_value'], environment['max_value'])
+            CountedStage.calls = 0
+            data = dataset.set_pipeline(preprocessing).load()
+            # Entries of the other recordings still hit, only the added one is preprocessed
+            added = dataset.query.filter(File.path == record).count()
+            self.assertGreater(added, 0)
+            self.assertEqual(CountedStage.calls, added)
+            self.assertEqual(len(data['labels']), dataset.query.count())
+
+    def test_prefix_cache(self):
+        dataset = PhysioNetEEGMMIDBDataset(self.PATH)
+        tasks = dataset._get_tasks()
+        with tempfile.TemporaryDirectory() as directory:
+            # Stages outputs are cached only if selected
+            preprocessing = Pipeline([
+                CommonChannelSet(),
+                ToDataframe(),
+                DynamicWindow(4),
+                Skewness(),
+                ToNumpy()
+            ], executor=Executor('serial'), cache=directory)
+            dataset.set_pipeline(preprocessing)
+            preprocessing.run(tasks)
+            self.assertEqual(Cache(directory).keys(), [])
+            outputs = []
+            for prefix, features, calls in [
+                ([CommonChannelSet()], Skewness(), len(tasks)),
+                # A later stage changed, the cached prefix is reused
+                ([CommonChannelSet()], Kurtosis(), 0),
+                # An earlier stage changed, the prefix is computed again
+                ([CommonChannelSet(), LowestFrequency()], Kurtosis(), len(tasks)),
+            ]:
+                CountedStage.calls = 0
+                preprocessing = Pipeline(prefix + [
+                    CountedStage(),
+                    ToDataframe(),
+                    DynamicWindow(4),
+                    features,
+                    ToNumpy()
+                ], executor=Executor('serial'), cache=directory, cache_stages=[len(prefix)])
+                dataset.set_pipeline(preprocessing)
+                outputs.append(np.asarray(list(preprocessing.imap(tasks))))
+                self.assertEqual(CountedStage.calls, calls)
+            self.assertEqual(len(Cache(directory).keys()), 2 * len(tasks))
+        # Resumed outputs match the ones computed from scratch
+        preprocessing = Pipeline([
+            CommonChannelSet(),
+            CountedStage(),
+            ToDataframe(),
+            DynamicWindow(4),
+            Kurtosis(),
+            ToNumpy()
+        ], executor=Executor('serial'))
+        dataset.set_pipeline(preprocessing)
+        self.assertTrue(np.array_equal(outputs[1], np.asarray(list(preprocessing.imap(tasks)))))
+
+    def test_signal_statistics(self):
+        dataset = PhysioNetEEGMMIDBDataset(self.PATH)
+        path = dataset.query.first()[0].path
+        raw = read_raw_edf(path, verbose=False)
+        data = raw.get_data()
+        # Chunks smaller than the recording, so partial extremes are merged
+        statistics = signal_statistics(raw, chunk_size=len(raw.ch_names) * 1000)
+        self.assertTrue(np.array_equal(statistics['min'], data.min(axis=1)))
+        self.assertTrue(np.array_equal(statistics['max'], data.max(axis=1)))
+        metadata = dataset.session.query(Metadata).filter(Metadata.file_uuid == dataset._get_uuid(path)).one()
+        self.assertTrue(np.allclose([metadata.min_value, metadata.max_value], [data.min(), data.max()], rtol=0, atol=1e-12))
+
+    def test_output_spec_durations(self):
+        dataset = PhysioNetEEGMMIDBDataset(self.PATH)
+        tasks = dataset._get_tasks()[:2]
+        tasks[1] = tasks[1]._replace(end=tasks[1].begin + 2 * tasks[1].duration)
+        windows = Pipeline([CommonChannelSet(), ToDataframe(), DynamicWindow(2), ToNumpy()])
+        features = Pipeline([CommonChannelSet(), ToDataframe(), DynamicWindow(2), Skewness(), ToNumpy()])
+        # Windows length depends on the duration, the output is not preallocated
+        dataset.set_pipeline(windows)
+        self.assertIsNotNone(windows.get_output_spec(tasks[:1]))
+        self.assertIsNone(windows.get_output_spec(tasks))
+        # Windows features do not
+        dataset.set_pipeline(features)
+        self.assertIsNotNone(features.get_output_spec(tasks))
+        self.assertEqual(features.get_output_spec(tasks), features.get_output_spec(tasks[:1]))
+
+    def test_output_spec_annotations(self):
+        dataset = PhysioNetEEGMMIDBDataset(self.PATH)
+        preprocessing = Pipeline([CommonChannelSet(), ToDataframe(), DynamicWindow(2), ToNumpy()])
+        dataset.set_pipeline(preprocessing)
+        annotations = [annotation for _, _, annotation in dataset.query.all()][:1]
+        tasks = dataset._get_tasks()[:1]
+        # Annotations read their sampling frequency from the index
+        self.assertEqual([preprocessing._get_task(annotation) for annotation in annotations], tasks)
+        self.assertIsNotNone(preprocessing.get_output_spec(annotations))
+        self.assertEqual(preprocessing.get_output_spec(annotations), preprocessing.get_output_spec(tasks))
+        # Spec is not probed at an unknown sampling frequency
+        self.assertIsNone(preprocessing.get_output_spec([task._replace(sfreq=None) for task in tasks]))
+
+    def test_output_end_of_recording(self):
+        dataset = PhysioNetEEGMMIDBDataset(self.PATH)
+        task = dataset._get_tasks()[0]
+        # Windows reaching the end of recording are clamped by read_window
+        tasks = [task._replace(begin=task.file_duration - 5, end=task.file_duration)] * 3
+        preprocessing = Pipeline([CommonChannelSet(), ToDataframe(), DynamicWindow(2), ToNumpy()])
+        dataset.set_pipeline(preprocessing)
+        expected = np.asarray([result for _, result in sorted(preprocessing.imap_unordered(tasks))])
+        self.assertEqual(preprocessing.get_output_spec(tasks)[0], expected.shape[1:])
+        data = preprocessing.run(tasks)['data']
+        self.assertTrue(np.array_equal(data, expected))
+        # Results of different shapes are not broadcast into the output
+        tasks[1] = task._replace(end=task.begin + 2 * task.duration)
+        data = preprocessing.transform(tasks)
+        self.assertEqual(len(data), 3)
+        self.assertEqual(np.shape(data[0]), expected.shape[1:])
+        self.assertNotEqual(np.shape(data[1]), expected.shape[1:])
+
+    def test_shared_output_mismatch(self):
+        dataset = PhysioNetEEGMMIDBDataset(self.PATH)
+        task = dataset._get_tasks()[0]
+        # Without the recording duration the end of recording clamp is not probed
+        tasks = [task._replace(begin=task.file_duration - 5, end=task.file_duration, file_duration=None)] * 3
+        outputs = []
+        for shared_output in [False, True]:
+            preprocessing = Pipeline([
+                CommonChannelSet(), ToDataframe(), DynamicWindow(2), ToNumpy()
+            ], executor=Executor('process', n_jobs=2), shared_output=shared_output)
+            dataset.set_pipeline(preprocessing)
+            outputs.append(preprocessing.run(tasks)['data'])
+        self.assertNotEqual(preprocessing.get_output_spec(tasks)[0], outputs[0].shape[1:])
+        # Results are sent back instead of being written
+        self.assertTrue(np.array_equal(outputs[0], outputs[1]))
+        outputs = []
+        for shared_output in [False, True]:
+            dataset = dataset.set_pipeline(Pipeline([
+                CommonChannelSet(), ToDataframe(), DynamicWindow(2), Skewness(), ToNumpy()
+            ], shared_output=shared_output))
+            dataset.get_cache().purge()
+            with mock.patch.object(Pipeline, 'get_output_spec', return_value=((1, ), np.float64)):
+                outputs.append(dataset.load()['data'])
+        self.assertTrue(np.array_equal(outputs[0], outputs[1]))
+
     def test_loader(self):
         loader = PhysioNetEEGMMIDBDataset(self.PATH)
         loader.maximal_channels_subset
@@ -29,3 +249,71 @@ class TestEEGMMIDB(unittest.TestCase):
             ToNumpy()
         ])
         dataset = dataset.set_pipeline(preprocessing).load()
+
+    def test_iter_batches(self):
+        dataset = PhysioNetEEGMMIDBDataset(self.PATH)
+        preprocessing = Pipeline([
+            CommonChannelSet(),
+            LowestFrequency(),
+            BandPassFrequency(0.1, 47),
+            ToDataframe(),
+            DynamicWindow(4),
+            Skewness(),
+            ToNumpy()
+        ])
+        dataset = dataset.set_pipeline(preprocessing)
+        dataset.get_cache().purge()
+        with mock.patch.object(Executor, '_get_pool', autospec=True, side_effect=Executor._get_pool) as get_pool:
+            batches = list(dataset.iter_batches(4, shuffle=True, seed=42))
+        # A single workers pool serves all the batches
+        self.assertEqual(get_pool.call_count, 1)
+        self.assertTrue(all(len(x) == len(y) <= 4 for x, y in batches))
+        self.assertEqual(sum(len(y) for _, y in batches), dataset.query.count())
+
+    def test_group_by_file(self):
+        dataset = PhysioNetEEGMMIDBDataset(self.PATH)
+        data = [
+            dataset.set_pipeline(Pipeline([
+                CommonChannelSet(),
+                ToDataframe()
+            ], group_by_file=group_by_file)).load()['data']
+            for group_by_file in [False, True]
+        ]
+        for windowed, grouped in zip(*data):
+            self.assertTrue(windowed.equals(grouped))
+
+    def test_skip_errors(self):
+        dataset = PhysioNetEEGMMIDBDataset(self.PATH)
+        preprocessing = Pipeline([
+            CommonChannelSet(),
+            CorruptedRecording(),
+            ToDataframe(),
+            ToNumpy()
+        ], errors='skip', retries=1)
+        data = dataset.set_pipeline(preprocessing).load()
+        self.assertEqual(len(data['labels']), 0)
+        self.assertEqual(len(data['failures']), dataset.query.count())
+        self.assertTrue(all(failure['attempts'] == 2 for failure in data['failures']))
+
+    def test_killed_worker(self):
+        dataset = PhysioNetEEGMMIDBDataset(self.PATH)
+        preprocessing = Pipeline([
+            CommonChannelSet(),
+            KilledWorker(),
+            ToDataframe()
+        ], executor=Executor('process', n_jobs=2))
+        dataset = dataset.set_pipeline(preprocessing)
+        cache = dataset.get_cache()
+        cache.purge()
+        with tempfile.TemporaryDirectory() as directory:
+            os.environ['KILL_COUNTER'] = os.path.join(directory, 'counter')
+            try:
+                with self.assertRaises(BrokenProcessPool):
+                    dataset.load()
+            finally:
+                del os.environ['KILL_COUNTER']
+        # Annotations completed before the worker died are checkpointed
+        checkpointed = len(cache.keys())
+        self.assertGreaterEqual(checkpointed, 2)
+        data = dataset.load()
+        self.assertEqual(len(data['labels']), dataset.query.count())
@@ -0,0 +1,57 @@
+import os
+import sys
+import time
+import unittest
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from pyeeglab import *
+
+def sleep(seconds):
+    time.sleep(seconds)
+    return seconds
+
+class TestExecutor(unittest.TestCase):
+
+    def test_backends(self):
+        for backend in ['serial', 'thread', 'process', 'forkserver']:
+            executor = Executor(backend, n_jobs=2, chunksize=1)
+            self.assertEqual(executor.map(abs, range(-8, 8)), [abs(i) for i in range(-8, 8)])
+
+    def test_imap_unordered(self):
+        executor = Executor('thread', n_jobs=2)
+        results = sorted(executor.imap_unordered(abs, [-3, -2, -1]))
+        self.assertEqual(results, [(0, 3), (1, 2), (2, 1)])
+
+    def test_context(self):
+        with Executor(n_jobs=2) as executor:
+            self.assertEqual(executor.map(abs, [-1, -2]), [1, 2])
+            self.assertEqual(executor.map(abs, [-3]), [3])
+
+    def test_timeout(self):
+        executor = Executor('process', n_jobs=2, timeout=2)
+        results = dict(executor.imap_unordered(sleep, [0, 60, 0, 0]))
+        self.assertIsInstance(results.pop(1), TimeoutError)
+        self.assertEqual(results, {0: 0, 2: 0, 3: 0})
+
+    def test_multiprocessing_pools(self):
+        # Python 3.6 concurrent.futures executors do not accept initializers
+        from pyeeglab import executor as module
+        module.FUTURES = False
+        try:
+            for backend in ['thread', 'process', 'forkserver']:
+                executor = Executor(backend, n_jobs=2, initializer=abs, initargs=(-1, ))
+                self.assertEqual(executor.map(abs, range(-8, 8)), [abs(i) for i in range(-8, 8)])
+                with executor:
+                    self.assertEqual(executor.map(abs, [-1, -2]), [1, 2])
+        finally:
+            module.FUTURES = True
+
+    def test_timeout_kills_stuck_workers_only(self):
+        # Running tasks are not restarted when another one times out
+        executor = Executor('process', n_jobs=2, timeout=2)
+        start = time.monotonic()
+        results = dict(executor.imap_unordered(sleep, [30, 0.5, 1.8, 30, 1.8]))
+        self.assertLess(time.monotonic() - start, 5.5)
+        self.assertIsInstance(results.pop(0), TimeoutError)
+        self.assertIsInstance(results.pop(3), TimeoutError)
+        self.assertEqual(results, {1: 0.5, 2: 1.8, 4: 1.8})
@@ -0,0 +1,38 @@
+import os
+import sys
+import subprocess
+import unittest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+class TestImport(unittest.TestCase):
+    HEAVY = ['mne', 'yasa', 'wfdb', 'scipy', 'pandas', 'sqlalchemy']
+
+    def _run(self, code: str) -> str:
+        code = 'import sys; sys.path.insert(0, {!r}); '.format(ROOT) + code
+        return subprocess.run(
+            [sys.executable, '-c', code],
+            stdout=subprocess.PIPE,
+            check=True
+        ).stdout.decode().strip()
+
+    def test_lazy_import(self):
+        modules = self._run(
+            'import pyeeglab; '
+            'print(",".join(m for m in {!r} if m in sys.modules))'.format(self.HEAVY)
+        )
+        self.assertEqual(modules, '')
+
+    def test_import_time(self):
+        elapsed = self._run(
+            'import time; start = time.perf_counter(); import pyeeglab; '
+            'print(time.perf_counter() - start)'
+        )
+        self.assertLess(float(elapsed), 1.0)
+
+    def test_attributes(self):
+        attributes = self._run(
+            'from pyeeglab import *; '
+            'print(Pipeline.__name__, PhysioNetCHBMITDataset.__name__, Bandpower.__name__)'
+        )
+        self.assertEqual(attributes, 'Pipeline PhysioNetCHBMITDataset Bandpower')
@@ -1,6 +1,7 @@
 import os
 import sys
 import unittest
+import numpy as np
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from pyeeglab import *
@@ -29,3 +30,43 @@ class TestTUHEEGAbnormal(unittest.TestCase):
             ToNumpy()
         ])
         dataset = dataset.set_pipeline(preprocessing).load()
+
+    def test_dataset_numpy_cache(self):
+        dataset = TUHEEGAbnormalDataset(self.PATH)
+        preprocessing = Pipeline([
+            CommonChannelSet(),
+            LowestFrequency(),
+            BandPassFrequency(0.1, 47),
+            ToDataframe(),
+            DynamicWindow(4),
+            Skewness(),
+            ToNumpy()
+        ])
+        dataset = dataset.set_pipeline(preprocessing)
+        data = dataset.load(cache_format='numpy')
+        cache = dataset.load(cache_format='numpy')
+        self.assertIsInstance(cache['data'], np.memmap)
+        self.assertTrue(np.array_equal(data['data'], cache['data']))
+        self.assertEqual(data['labels_encoder'], cache['labels_encoder'])
+
+    def test_eeg_array(self):
+        dataset = TUHEEGAbnormalDataset(self.PATH)
+        expected = Pipeline([
+            CommonChannelSet(),
+            LowestFrequency(),
+            ToDataframe(),
+            DynamicWindow(4),
+            Kurtosis(),
+            ToNumpy()
+        ])
+        expected = dataset.set_pipeline(expected).load()
+        preprocessing = Pipeline([
+            CommonChannelSet(),
+            LowestFrequency(),
+            ToEEGArray(),
+            DynamicWindow(4),
+            Kurtosis(),
+            ToNumpy()
+        ])
+        data = dataset.set_pipeline(preprocessing).load()
+        self.assertTrue(np.array_equal(expected['data'], data['data']))
@@ -1,10 +1,19 @@
 import os
 import sys
+import tempfile
 import unittest
+import numpy as np
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from pyeeglab import *
 
+class CountedRun(Preprocessor):
+    calls = 0
+
+    def run(self, data, **kwargs):
+        CountedRun.calls += 1
+        return data
+
 class TestTUHEEGArtifact(unittest.TestCase):
     PATH = './tests/samples/tuh_eeg_artifact/'
 
@@ -17,6 +26,11 @@ class TestTUHEEGArtifact(unittest.TestCase):
         loader.lowest_frequency
         loader.signal_min_max_range
 
+    def test_channels_set(self):
+        loader = TUHEEGArtifactDataset(self.PATH)
+        channels = loader.maximal_channels_subset
+        self.assertEqual(loader.query.count(), loader.with_channels_set(channels).count())
+
     def test_dataset(self):
         dataset = TUHEEGArtifactDataset(self.PATH)
         preprocessing = Pipeline([
@@ -29,3 +43,85 @@ class TestTUHEEGArtifact(unittest.TestCase):
             ToNumpy()
         ])
         dataset = dataset.set_pipeline(preprocessing).load()
+
+    def test_annotations_cache(self):
+        dataset = TUHEEGArtifactDataset(self.PATH)
+        preprocessing = Pipeline([
+            CommonChannelSet(),
+            LowestFrequency(),
+            BandPassFrequency(0.1, 47),
+            ToDataframe(),
+            DynamicWindow(4),
+            Skewness(),
+            ToNumpy()
+        ])
+        dataset = dataset.set_pipeline(preprocessing)
+        dataset.get_cache().purge()
+        data = dataset.load()
+        # Only per-annotation entries are stored, the result is rebuilt from them
+        self.assertEqual(len(dataset.get_cache().keys()), len(data['labels']))
+        self.assertTrue(np.array_equal(dataset.load()['data'], data['data']))
+
+    def test_profile(self):
+        dataset = TUHEEGArtifactDataset(self.PATH)
+        preprocessing = Pipeline([
+            CommonChannelSet(),
+            LowestFrequency(),
+            ToDataframe(),
+            DynamicWindow(4),
+            Skewness(),
+            ToNumpy()
+        ], profile=True)
+        dataset.set_pipeline(preprocessing)
+        data = preprocessing.run(dataset._get_tasks())
+        stages = preprocessing.profiler.get_stages()
+        self.assertEqual([stage['stage'] for stage in stages], list(range(-1, 6)))
+        self.assertTrue(all(stage['calls'] == len(data['labels']) for stage in stages))
+        self.assertGreater(preprocessing.profiler.get_throughput()['samples_per_second'], 0)
+
+    def test_output_spec(self):
+        dataset = TUHEEGArtifactDataset(self.PATH)
+        preprocessing = Pipeline([
+            CountedRun(),
+            CommonChannelSet(),
+            LowestFrequency(),
+            ToDataframe(),
+            DynamicWindow(4),
+            Skewness(),
+            ToNumpy()
+        ], executor=Executor('serial'), shared_output=True)
+        dataset = dataset.set_pipeline(preprocessing)
+        dataset.get_cache().purge()
+        data = dataset.load()
+        # Output spec is not probed on a real annotation, each one runs once
+        self.assertEqual(CountedRun.calls, dataset.query.count())
+        self.assertEqual(len(data['data']), dataset.query.count())
+
+    def test_shared_output(self):
+        dataset = TUHEEGArtifactDataset(self.PATH)
+        tasks = dataset._get_tasks()
+        outputs = []
+        with tempfile.TemporaryDirectory() as directory:
+            for shared_output in [True, False]:
+                preprocessing = Pipeline([
+                    CommonChannelSet(),
+                    LowestFrequency(),
+                    ToDataframe(),
+                    DynamicWindow(4),
+                    Skewness(),
+                    ToNumpy()
+                ], executor=Executor('process', n_jobs=2), shared_output=shared_output, shared_output_dir=directory)
+                dataset.set_pipeline(preprocessing)
+                # Workers write into the shared output only if its spec is inferred
+                self.assertIsNotNone(preprocessing.get_output_spec(tasks))
+                outputs.append(preprocessing.run(tasks)['data'])
+            # The backing file is removed once the run completes
+            self.assertEqual(os.listdir(directory), [])
+        self.assertTrue(np.array_equal(outputs[0], outputs[1]))
+
+    def test_shared_output_no_room(self):
+        with tempfile.TemporaryDirectory() as directory:
+            preprocessing = Pipeline([ToNumpy()], shared_output=True, shared_output_dir=directory)
+            # Outputs larger than the free space are not shared
+            self.assertIsNone(preprocessing.allocate_output(1, ((2 ** 50, ), np.float64)))
+            self.assertEqual(os.listdir(directory), [])